@@ -0,0 +1,154 @@
+"""Batch position analysis: scores, winners and threat counts for many boards.
+
+Boards are stacked into an (N, size, size) integer array: 0 empty, 1 X, 2 O.
+With NumPy installed every win_condition-long window of every board is
+counted with shifted array sums, one pass per direction. Without NumPy the
+same results come from the engine's incremental evaluator, one board at a time.
+
+Scores match PatternEvaluator.score (positive favours O). threats[n][p][k]
+is the number of live windows holding k stones of player p (0 = X, 1 = O) and
+none of the opponent's.
+
+Examples:
+    python caro_batch.py bench --size 15 --win 5 --count 20000
+    python caro_batch.py score --win 5 --input boards.npy --output scores.npz
+"""
+import argparse
+import random
+import sys
+import time
+
+from caro_engine import BitBoard, CaroAI, PatternEvaluator
+
+try:
+    import numpy as np
+except ImportError:  # optional: the pure-Python path below still works
+    np = None
+
+
+EMPTY, X, O = 0, 1, 2
+STONES = {'': EMPTY, 'X': X, 'O': O}
+
+
+def encode_boards(boards):
+    # Lists of rows of '', 'X', 'O' -> (N, size, size) array, or nested lists without NumPy
+    encoded = [[[STONES[cell] for cell in row] for row in board] for board in boards]
+    return np.array(encoded, dtype=np.int8) if np is not None else encoded
+
+
+def window_views(stones, win_condition):
+    # For each direction, the stone count of every window: (N, rows, cols) per direction
+    size = stones.shape[1]
+    counts = []
+    for dr, dc in CaroAI.DIRECTIONS:
+        rows = size - (win_condition - 1) * dr
+        cols = size - (win_condition - 1) * abs(dc)
+        if rows <= 0 or cols <= 0:
+            continue
+        total = np.zeros((stones.shape[0], rows, cols), dtype=np.int8)
+        for k in range(win_condition):
+            row = k * dr
+            col = k * dc if dc >= 0 else win_condition - 1 - k
+            total += stones[:, row:row + rows, col:col + cols]
+        counts.append(total.reshape(stones.shape[0], -1))
+    return np.concatenate(counts, axis=1)
+
+
+def analyse_batch(boards, win_condition):
+    # Returns {'score', 'winner', 'threats'}: winner is 0 (none), 1 (X) or 2 (O)
+    if np is None:
+        return analyse_batch_python(boards, win_condition)
+    boards = np.asarray(boards, dtype=np.int8)
+    x_counts = window_views((boards == X).astype(np.int8), win_condition)
+    o_counts = window_views((boards == O).astype(np.int8), win_condition)
+
+    # Live windows only: a window with both colours can never be completed
+    x_live = np.where(o_counts == 0, x_counts, 0)
+    o_live = np.where(x_counts == 0, o_counts, 0)
+    threats = np.zeros((boards.shape[0], 2, win_condition + 1), dtype=np.int64)
+    for k in range(1, win_condition + 1):
+        threats[:, 0, k] = (x_live == k).sum(axis=1)
+        threats[:, 1, k] = (o_live == k).sum(axis=1)
+
+    weights = np.array([0] + [10 ** (k - 1) for k in range(1, win_condition + 1)], dtype=np.int64)
+    score = (threats[:, 1] * weights).sum(axis=1) - (threats[:, 0] * weights).sum(axis=1)
+    winner = np.where(threats[:, 0, win_condition] > 0, X, np.where(threats[:, 1, win_condition] > 0, O, EMPTY))
+    return {'score': score, 'winner': winner.astype(np.int8), 'threats': threats}
+
+
+def analyse_batch_python(boards, win_condition):
+    scores, winners, threats = [], [], []
+    for board in boards:
+        size = len(board)
+        evaluator = PatternEvaluator(size, win_condition)
+        bitboard = BitBoard(size, win_condition)
+        for row in range(size):
+            for col in range(size):
+                player = 'X' if board[row][col] == X else 'O' if board[row][col] == O else None
+                if player:
+                    evaluator.place(row, col, player)
+                    bitboard.place(row, col, player)
+        scores.append(evaluator.score)
+        winners.append(X if bitboard.is_win('X') else O if bitboard.is_win('O') else EMPTY)
+        threats.append([[0] + evaluator.pattern_counts[player][1:] for player in ('X', 'O')])
+    return {'score': scores, 'winner': winners, 'threats': threats}
+
+
+def random_boards(count, size, seed=1):
+    # Random positions for benchmarking, with 10-40% of the cells filled
+    rng = random.Random(seed)
+    boards = []
+    for _ in range(count):
+        board = [[EMPTY] * size for _ in range(size)]
+        cells = [(row, col) for row in range(size) for col in range(size)]
+        rng.shuffle(cells)
+        stones = rng.randint(size * size // 10, size * size * 2 // 5)
+        for i, (row, col) in enumerate(cells[:stones]):
+            board[row][col] = X if i % 2 == 0 else O
+        boards.append(board)
+    return boards
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Caro batch position analysis')
+    commands = parser.add_subparsers(dest='command', required=True)
+    bench = commands.add_parser('bench', help='time the batch path against one board at a time')
+    bench.add_argument('--size', type=int, default=15)
+    bench.add_argument('--win', type=int, default=5)
+    bench.add_argument('--count', type=int, default=10000)
+    bench.add_argument('--seed', type=int, default=1)
+    score = commands.add_parser('score', help='analyse an (N, size, size) .npy array of boards')
+    score.add_argument('--win', type=int, required=True)
+    score.add_argument('--input', required=True)
+    score.add_argument('--output', required=True, help='.npz with score, winner and threats')
+    args = parser.parse_args(argv)
+
+    if args.command == 'score':
+        if np is None:
+            parser.error('the score command needs NumPy')
+        result = analyse_batch(np.load(args.input), args.win)
+        np.savez(args.output, **result)
+        print('%s: %d boards' % (args.output, len(result['score'])))
+        return 0
+
+    boards = random_boards(args.count, args.size, args.seed)
+    started = time.perf_counter()
+    expected = analyse_batch_python(boards, args.win)
+    python_time = time.perf_counter() - started
+    print('one at a time: %.0f boards/s' % (args.count / python_time))
+    if np is None:
+        print('NumPy is not installed, no batch timing')
+        return 0
+    array = np.array(boards, dtype=np.int8)
+    started = time.perf_counter()
+    result = analyse_batch(array, args.win)
+    batch_time = time.perf_counter() - started
+    print('batch: %.0f boards/s (%.1fx)' % (args.count / batch_time, python_time / batch_time))
+    if list(result['score']) != expected['score'] or list(result['winner']) != expected['winner']:
+        print('MISMATCH between batch and per-board results')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,257 @@
+"""Benchmarks for the engine hot path on a fixed corpus of positions.
+
+The corpus covers 3x3 to 19x19 boards, every win condition from 3 to 6 that
+fits, and opening, midgame and near-win positions. Positions are generated
+from fixed seeds, so they are identical from run to run. Results are JSON, and
+two result files can be compared to spot regressions between commits.
+
+Examples:
+    python caro_bench.py --output before.json
+    python caro_bench.py --quick --filter 15x15
+    python caro_bench.py --compare before.json after.json
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from caro_engine import CaroAI, CaroGame, PatternEvaluator, TranspositionTable
+
+
+SIZES = [3, 4, 5, 7, 10, 15, 19]
+WIN_CONDITIONS = [3, 4, 5, 6]
+PHASES = ['opening', 'midgame', 'near_win']
+
+
+# ===== CORPUS =====
+def build_position(size, win_condition, phase):
+    # Seeded random play that never completes a line. near_win stops at the
+    # first position where a player has a winning move available.
+    rng = random.Random('%d-%d-%s' % (size, win_condition, phase))
+    game = CaroGame({'board_size': size, 'win_condition': win_condition})
+    target = {
+        'opening': min(3, size * size // 3),
+        'midgame': min(24, size * size // 3),
+        'near_win': size * size
+    }[phase]
+
+    while len(game.move_history) < target:
+        player = game.current_player
+        moves = []
+        for row, col in game.candidate_moves.moves():
+            game.bitboard.place(row, col, player)
+            if not game.bitboard.is_win(player):
+                moves.append((row, col))
+            game.bitboard.remove(row, col, player)
+        if not moves:
+            break
+        if game.play(*rng.choice(moves)) is not None:
+            break
+        if phase == 'near_win' and (game.find_winning_move('X') or game.find_winning_move('O')):
+            break
+    return game
+
+
+def corpus(name_filter=None):
+    positions = []
+    for size in SIZES:
+        for win_condition in WIN_CONDITIONS:
+            if win_condition > size:
+                continue
+            for phase in PHASES:
+                name = '%dx%d/%d/%s' % (size, size, win_condition, phase)
+                if name_filter and name_filter not in name:
+                    continue
+                positions.append((name, build_position(size, win_condition, phase)))
+    return positions
+
+
+# ===== BENCHMARKS =====
+def rate(function, min_time=0.05):
+    # Calls per second, repeating until at least min_time has passed
+    calls = 0
+    started = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_time:
+        for _ in range(100):
+            function()
+        calls += 100
+        elapsed = time.perf_counter() - started
+    return calls / elapsed
+
+
+def bench_check_winner(game):
+    bitboard = game.bitboard
+    return {'calls_per_second': rate(lambda: (bitboard.is_win('X'), bitboard.is_win('O')))}
+
+
+def bench_evaluate_board(game):
+    ai = game.create_ai()
+    player = game.current_player
+    moves = ai.get_available_moves() or [(0, 0)]
+    move_iter = iter(())
+
+    def make_unmake():
+        nonlocal move_iter
+        try:
+            row, col = next(move_iter)
+        except StopIteration:
+            move_iter = iter(moves)
+            row, col = next(move_iter)
+        ai.place(row, col, player)
+        ai.evaluate_board()
+        ai.remove(row, col)
+
+    def from_scratch():
+        evaluator = PatternEvaluator(game.size, game.win_condition)
+        for row, col, stone in game.move_history:
+            evaluator.place(row, col, stone)
+        return evaluator.score
+
+    return {
+        'incremental_per_second': rate(make_unmake),
+        'full_rebuild_per_second': rate(from_scratch)
+    }
+
+
+def bench_get_available_moves(game):
+    ai = game.create_ai()
+    unordered = CaroAI(game.board, game.win_condition, order_moves=False)
+    return {
+        'ordered_per_second': rate(ai.get_available_moves),
+        'unordered_per_second': rate(unordered.get_available_moves),
+        'branching': len(ai.get_available_moves())
+    }
+
+
+def bench_minimax(game, depth, time_limit_ms):
+    player = game.current_player
+    ai = CaroAI(game.board, game.win_condition, time_limit_ms=time_limit_ms, max_depth=depth,
+                tt=TranspositionTable(16))
+    started = time.perf_counter()
+    move, score, reached = ai.search(player)
+    elapsed = time.perf_counter() - started
+
+    # Separate run for memory: tracemalloc slows the search down
+    tracemalloc.start()
+    CaroAI(game.board, game.win_condition, time_limit_ms=time_limit_ms, max_depth=depth,
+           tt=TranspositionTable(16)).search(player)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'move': list(move) if move else None,
+        'score': score,
+        'depth': reached,
+        'nodes': ai.nodes,
+        'nodes_per_second': ai.nodes / elapsed if elapsed else 0.0,
+        'time_to_depth_ms': {str(d): round(seconds * 1000, 3) for d, _, _, _, seconds in ai.iterations},
+        'peak_memory_kb': round(peak / 1024, 1)
+    }
+
+
+def run(args):
+    results = {}
+    for name, game in corpus(args.filter):
+        if game.winner is not None or game.bitboard.is_full():
+            continue
+        entry = {
+            'stones': len(game.move_history),
+            'to_move': game.current_player,
+            'check_winner': bench_check_winner(game),
+            'evaluate_board': bench_evaluate_board(game),
+            'get_available_moves': bench_get_available_moves(game)
+        }
+        if not args.skip_search:
+            entry['minimax'] = bench_minimax(game, args.depth, args.time_ms)
+        results[name] = entry
+        print(name, file=sys.stderr)
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'commit': current_commit(),
+            'depth': args.depth,
+            'time_ms': args.time_ms
+        },
+        'results': results
+    }
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+# ===== COMPARISON =====
+def flatten(prefix, value, out):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            flatten('%s.%s' % (prefix, key) if prefix else key, item, out)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        out[prefix] = value
+    return out
+
+
+METRIC_SUFFIXES = (('_per_second', 1), ('_ms', -1), ('_kb', -1))  # +1: higher is better
+
+
+def metric_direction(key):
+    # 1 or -1 for a measurement, None for anything else. The unit may sit on an
+    # inner segment, as in "...time_to_depth_ms.3".
+    for part in reversed(key.split('.')):
+        for suffix, direction in METRIC_SUFFIXES:
+            if part.endswith(suffix):
+                return direction
+    return None
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = flatten('', json.load(f)['results'], {})
+    with open(new_path) as f:
+        new = flatten('', json.load(f)['results'], {})
+    for key in sorted(old.keys() & new.keys()):
+        direction = metric_direction(key)
+        if direction is None or not old[key]:
+            continue
+        change = new[key] / old[key] - 1
+        verdict = 'same' if not change else 'better' if change * direction > 0 else 'worse'
+        print('%-70s %12.1f %12.1f %+7.1f%%  %s' % (key, old[key], new[key], change * 100, verdict))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Caro engine benchmarks')
+    parser.add_argument('--depth', type=int, default=3, help='fixed search depth for the minimax benchmark')
+    parser.add_argument('--time-ms', type=int, default=5000, help='time cap per search')
+    parser.add_argument('--quick', action='store_true', help='depth 2 searches')
+    parser.add_argument('--skip-search', action='store_true', help='only the micro benchmarks')
+    parser.add_argument('--filter', help='only positions whose name contains this, e.g. 15x15')
+    parser.add_argument('--output', help='write JSON here instead of stdout')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+    if args.quick:
+        args.depth = 2
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
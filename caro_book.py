@@ -0,0 +1,197 @@
+"""Opening book: precomputed best replies for early positions.
+
+A book file covers one board size and win condition. It holds fixed-size
+records sorted by the position's symmetry-canonical Zobrist hash, so a lookup
+is a binary search. Small files are read on first use and large ones are
+memory-mapped. Moves are stored in the canonical frame and mapped back onto
+the real board when probed.
+
+Examples:
+    python caro_book.py generate --size 15 --win 5 --plies 4 --width 4 --time-ms 5000
+    python caro_book.py probe --size 15 --win 5 --moves "7,7"
+    python caro_book.py info --size 15 --win 5
+"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+from collections import deque
+
+from caro_engine import CaroAI, CaroGame, canonical_hash, parse_moves, symmetry_maps
+
+
+def book_path(size, win_condition, directory='.'):
+    return os.path.join(directory, 'caro_book_%dx%d_%d.bin' % (size, size, win_condition))
+
+
+class OpeningBook:
+    MAGIC = b'CARB'
+    VERSION = 1
+    HEADER = struct.Struct('<4sBBBxI')  # magic, version, size, win, count
+    RECORD = struct.Struct('<QBBhBxxx')  # key, row, col, score, depth
+    MMAP_THRESHOLD = 1 << 20
+
+    def __init__(self, path):
+        self.path = path
+        self.loaded = False
+        self.data = None
+        self.file = None
+        self.count = 0
+
+    def load(self):
+        # Deferred to the first lookup so games without a book pay nothing
+        self.loaded = True
+        if not os.path.exists(self.path):
+            return
+        file_size = os.path.getsize(self.path)
+        if file_size < self.HEADER.size:
+            return
+        self.file = open(self.path, 'rb')
+        if file_size >= self.MMAP_THRESHOLD:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.data = self.file.read()
+            self.file.close()
+            self.file = None
+        magic, version, self.size, self.win_condition, count = self.HEADER.unpack_from(self.data, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            self.close()
+            return
+        self.count = count
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        if self.file is not None:
+            self.file.close()
+        self.data = None
+        self.file = None
+        self.count = 0
+
+    def probe(self, key):
+        # Binary search over the sorted records; returns (row, col, score, depth)
+        if not self.loaded:
+            self.load()
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            record = self.RECORD.unpack_from(self.data, self.HEADER.size + middle * self.RECORD.size)
+            if record[0] < key:
+                low = middle + 1
+            elif record[0] > key:
+                high = middle
+            else:
+                return record[1:]
+        return None
+
+    def lookup(self, board):
+        # Returns ((row, col), score, depth) on the real board, or None
+        key, symmetry = canonical_hash(board)
+        entry = self.probe(key)
+        if entry is None:
+            return None
+        row, col, score, depth = entry
+        _, inverses = symmetry_maps(len(board))
+        if not (0 <= row < len(board) and 0 <= col < len(board)):
+            return None
+        row, col = inverses[symmetry][row][col]
+        if board[row][col] != '':
+            return None  # hash collision
+        return (row, col), score, depth
+
+    @classmethod
+    def write(cls, path, size, win_condition, entries):
+        # entries: {canonical key: (row, col, score, depth)} in the canonical frame
+        with open(path, 'wb') as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, size, win_condition, len(entries)))
+            for key in sorted(entries):
+                row, col, score, depth = entries[key]
+                score = max(-32768, min(32767, score))
+                f.write(cls.RECORD.pack(key, row, col, score, depth))
+
+
+# ===== GENERATOR =====
+def generate(size, win_condition, plies, width, time_ms, log=None):
+    # Breadth-first over positions up to `plies` stones. Every position gets a
+    # deep search; its `width` best-ordered moves are expanded so likely human
+    # replies are covered too. Symmetric duplicates are searched once.
+    settings = {'board_size': size, 'win_condition': win_condition, 'ai_time_limit_ms': time_ms,
+                'ai_opening_book': False}
+    maps, _ = symmetry_maps(size)
+    entries = {}
+    queue = deque([[]])
+    while queue:
+        moves = queue.popleft()
+        game = CaroGame(settings)
+        for row, col in moves:
+            game.play(row, col)
+        if game.winner or game.bitboard.is_full():
+            continue
+        key, symmetry = canonical_hash(game.board)
+        if key in entries:
+            continue
+
+        game.last_search = None
+        row, col = game.get_hard_ai_move()
+        search = game.last_search or {'score': 0, 'depth': 0}
+        canonical_row, canonical_col = maps[symmetry][row][col]
+        entries[key] = (canonical_row, canonical_col, search['score'], search['depth'])
+        if log:
+            log('%d positions, %s -> %d,%d (depth %d)' % (len(entries), moves, row, col, search['depth']))
+
+        if len(moves) < plies:
+            if moves:
+                children = CaroAI(game.board, win_condition).get_available_moves()[:width]
+            else:
+                # Any first move near the centre, symmetric ones collapse to a few
+                center = size // 2
+                children = [(row, col) for row in range(max(0, center - 2), min(size, center + 3))
+                            for col in range(max(0, center - 2), min(size, center + 3))]
+            if (row, col) not in children:
+                children.append((row, col))
+            for child in children:
+                queue.append(moves + [child])
+    return entries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Caro opening book')
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name in ('generate', 'probe', 'info'):
+        sub = commands.add_parser(name)
+        sub.add_argument('--size', type=int, required=True)
+        sub.add_argument('--win', type=int, required=True)
+        sub.add_argument('--book', help='book file (default caro_book_<size>x<size>_<win>.bin)')
+        if name == 'generate':
+            sub.add_argument('--plies', type=int, default=4, help='deepest position in stones')
+            sub.add_argument('--width', type=int, default=4, help='replies expanded per position')
+            sub.add_argument('--time-ms', type=int, default=5000, help='search time per position')
+        if name == 'probe':
+            sub.add_argument('--moves', default='', help='moves played so far, X first, e.g. "7,7 7,8"')
+    args = parser.parse_args(argv)
+    path = args.book or book_path(args.size, args.win)
+
+    if args.command == 'generate':
+        started = time.perf_counter()
+        entries = generate(args.size, args.win, args.plies, args.width, args.time_ms,
+                           log=lambda text: print(text, file=sys.stderr))
+        OpeningBook.write(path, args.size, args.win, entries)
+        print('%s: %d positions in %.0f s' % (path, len(entries), time.perf_counter() - started))
+    elif args.command == 'probe':
+        game = CaroGame({'board_size': args.size, 'win_condition': args.win})
+        for row, col in parse_moves(args.moves):
+            game.play(row, col)
+        book = OpeningBook(path)
+        entry = book.lookup(game.board)
+        print('not in book' if entry is None else '%d %d (score %d, depth %d)' % (entry[0] + entry[1:]))
+    else:
+        book = OpeningBook(path)
+        book.load()
+        print('%s: %d positions' % (path, book.count))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+"""Persistent analysis cache: searched positions kept on disk between sessions.
+
+Results live in one SQLite file. Each is keyed by board size, win condition,
+win rule and the position's symmetry-canonical Zobrist hash, and its best move
+is stored in the canonical frame like the opening book's, so it answers every
+mirrored or rotated copy of the position too. Past --max-entries the least
+recently used positions are dropped, down to a tenth below the cap, so the
+rows are counted once per eviction rather than on every store. SQLite's file
+locking and write-ahead log let several game processes share one cache; any
+database error counts as a miss, so a locked or damaged file never stops a
+game.
+
+Examples:
+    python caro_cache.py info --cache caro_analysis.db
+    python caro_cache.py probe --cache caro_analysis.db --size 15 --win 5 --moves "7,7 7,8"
+    python caro_cache.py prune --cache caro_analysis.db --max-entries 10000
+"""
+import argparse
+import sqlite3
+import sys
+import time
+
+from caro_engine import CaroGame, canonical_hash, parse_moves, symmetry_maps
+
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS positions ('
+    ' size INTEGER NOT NULL, win INTEGER NOT NULL, rule TEXT NOT NULL, key INTEGER NOT NULL,'
+    ' row INTEGER NOT NULL, col INTEGER NOT NULL, score INTEGER NOT NULL, depth INTEGER NOT NULL,'
+    ' time_ms INTEGER NOT NULL, used REAL NOT NULL,'
+    ' PRIMARY KEY (size, win, rule, key))',
+    'CREATE INDEX IF NOT EXISTS positions_used ON positions (used)'
+]
+EVICT_SLACK = 0.1  # share of max_entries an eviction frees beyond the cap
+
+
+def signed(key):
+    # SQLite integers are signed 64-bit, Zobrist keys are not
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+
+class AnalysisCache:
+    def __init__(self, path, max_entries=100000, timeout=2.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.timeout = timeout  # seconds to wait for another process's write lock
+        self.connection = None
+        # Rows at the last count plus stores since. Updates and other processes'
+        # inserts make it drift, which only moves the next real count.
+        self.count = None
+
+    def connect(self):
+        # Opened on first use, and again after an error closed it
+        if self.connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                         check_same_thread=False)
+            try:
+                connection.execute('PRAGMA journal_mode=WAL')
+                connection.execute('PRAGMA synchronous=NORMAL')
+                for statement in SCHEMA:
+                    connection.execute(statement)
+            except sqlite3.Error:
+                connection.close()
+                raise
+            self.connection = connection
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        self.count = None
+
+    def lookup(self, board, win_condition, rule='freestyle', min_time_ms=0):
+        # ((row, col), score, depth) on the real board, from a search given at
+        # least min_time_ms, or None
+        key, symmetry = canonical_hash(board)
+        where = (len(board), win_condition, rule, signed(key))
+        try:
+            connection = self.connect()
+            entry = connection.execute('SELECT row, col, score, depth, time_ms FROM positions'
+                                       ' WHERE size = ? AND win = ? AND rule = ? AND key = ?', where).fetchone()
+            if entry is None or entry[4] < min_time_ms:
+                return None
+            connection.execute('UPDATE positions SET used = ? WHERE size = ? AND win = ? AND rule = ? AND key = ?',
+                               (time.time(),) + where)
+        except sqlite3.Error:
+            self.close()
+            return None
+        row, col, score, depth, _ = entry
+        _, inverses = symmetry_maps(len(board))
+        row, col = inverses[symmetry][row][col]
+        if board[row][col] != '':
+            return None  # hash collision
+        return (row, col), score, depth
+
+    def store(self, board, win_condition, rule, move, score, depth, time_ms):
+        # Keeps the deeper of the stored and the new result, then trims the cache
+        key, symmetry = canonical_hash(board)
+        maps, _ = symmetry_maps(len(board))
+        row, col = maps[symmetry][move[0]][move[1]]
+        try:
+            connection = self.connect()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.execute(
+                    'INSERT INTO positions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+                    ' ON CONFLICT (size, win, rule, key) DO UPDATE SET used = excluded.used,'
+                    ' row = CASE WHEN excluded.depth >= depth THEN excluded.row ELSE row END,'
+                    ' col = CASE WHEN excluded.depth >= depth THEN excluded.col ELSE col END,'
+                    ' score = CASE WHEN excluded.depth >= depth THEN excluded.score ELSE score END,'
+                    ' time_ms = CASE WHEN excluded.depth >= depth THEN excluded.time_ms ELSE time_ms END,'
+                    ' depth = MAX(depth, excluded.depth)',
+                    (len(board), win_condition, rule, signed(key), row, col, score, depth, time_ms, time.time()))
+                if self.count is None:
+                    self.count = connection.execute('SELECT COUNT(*) FROM positions').fetchone()[0]
+                else:
+                    self.count += 1
+                if self.count > self.max_entries:
+                    self.count = self.evict(connection, self.max_entries - int(self.max_entries * EVICT_SLACK))
+                connection.execute('COMMIT')
+            except sqlite3.Error:
+                connection.execute('ROLLBACK')
+                raise
+        except sqlite3.Error:
+            self.close()
+
+    def evict(self, connection, target):
+        # Drops the least recently used rows past target; returns the rows left
+        count = connection.execute('SELECT COUNT(*) FROM positions').fetchone()[0]
+        if count > target:
+            connection.execute('DELETE FROM positions WHERE rowid IN'
+                               ' (SELECT rowid FROM positions ORDER BY used LIMIT ?)', (count - target,))
+        return min(count, target)
+
+    def prune(self, max_entries=None):
+        # Trims to max_entries (default the cache's own cap); returns the entries left
+        if max_entries is not None:
+            self.max_entries = max_entries
+        connection = self.connect()
+        connection.execute('BEGIN IMMEDIATE')
+        self.count = self.evict(connection, self.max_entries)
+        connection.execute('COMMIT')
+        return self.count
+
+    def info(self):
+        # [(size, win, rule, entries)] per board configuration
+        return self.connect().execute('SELECT size, win, rule, COUNT(*) FROM positions'
+                                      ' GROUP BY size, win, rule ORDER BY size, win, rule').fetchall()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Caro persistent analysis cache')
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name in ('info', 'probe', 'prune'):
+        sub = commands.add_parser(name)
+        sub.add_argument('--cache', default='caro_analysis.db')
+        if name == 'probe':
+            sub.add_argument('--size', type=int, required=True)
+            sub.add_argument('--win', type=int, required=True)
+            sub.add_argument('--rule', choices=['freestyle', 'exact'], default='freestyle')
+            sub.add_argument('--moves', default='', help='moves played so far, X first, e.g. "7,7 7,8"')
+        if name == 'prune':
+            sub.add_argument('--max-entries', type=int, required=True)
+    args = parser.parse_args(argv)
+    cache = AnalysisCache(args.cache)
+
+    if args.command == 'info':
+        rows = cache.info()
+        print('%s: %d positions' % (args.cache, sum(row[3] for row in rows)))
+        for size, win, rule, count in rows:
+            print('  %dx%d/%d %s: %d' % (size, size, win, rule, count))
+    elif args.command == 'probe':
+        game = CaroGame({'board_size': args.size, 'win_condition': args.win, 'win_rule': args.rule})
+        for row, col in parse_moves(args.moves):
+            game.play(row, col)
+        entry = cache.lookup(game.board, args.win, args.rule)
+        print('not cached' if entry is None else '%d %d (score %d, depth %d)' % (entry[0] + entry[1:]))
+    else:
+        print('%s: %d positions left' % (args.cache, cache.prune(args.max_entries)))
+    cache.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
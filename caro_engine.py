@@ -0,0 +1,1680 @@
+"""Headless Caro engine: board, rules and AI, with a command-line entry point.
+
+Nothing here imports tkinter, so the engine can be scripted, benchmarked and
+tested without a display. The GUI in caro_game.py drives a CaroGame instance.
+
+Examples:
+    python caro_engine.py best --size 15 --win 5 --moves "7,7 7,8 8,8"
+    python caro_engine.py analyse --size 10 --win 5 --moves "4,4 5,5"
+    python caro_engine.py play --size 10 --win 5 --difficulty hard
+    python caro_engine.py best --size 19 --win 5 --engine mcts --time-ms 3000 --moves "9,9 9,10"
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+
+DEFAULT_SETTINGS = {
+    'board_size': 5,
+    'win_condition': 5,
+    'win_rule': 'freestyle',  # 'freestyle': win_condition or more in a row wins, 'exact': exactly win_condition
+    'ai_difficulty': 'medium',  # 'easy', 'medium', 'hard'
+    'ai_time_limit_ms': 1000,  # per-move search budget for the hard AI
+    'ai_tt_size_mb': 16,  # memory cap of the AI transposition table
+    'ai_candidate_radius': 2,  # AI only considers cells this close to a stone
+    'ai_workers': 1,  # processes for the hard AI root-split search, 1 = serial
+    'ai_opening_book': True,  # use caro_book_<size>x<size>_<win>.bin when present
+    'ai_symmetry': True,  # share search results between mirrored/rotated positions
+    'ai_solver': True,  # perfect play on small boards (caro_table_<size>x<size>_<win>.bin or an exact solve)
+    'ai_solver_empty_cells': 12,  # solve exactly once this few cells are left
+    'ai_vcf_nodes': 20000,  # node budget of the forced-win (VCF) search, 0 = off
+    'ai_search_log': None,  # JSON-lines file getting one record per AI move, None = off
+    'ai_ponder': True,  # hard AI keeps searching on the opponent's time, on its expected reply
+    'ai_analysis_cache': None,  # SQLite file of searched positions shared between sessions, None = off
+    'ai_analysis_cache_entries': 100000,  # least recently used positions are dropped beyond this
+    'ai_analysis_time_ms': 30000,  # how long analysis mode keeps deepening on one position
+    'ai_engine': 'alphabeta',  # hard AI search: 'alphabeta' or 'mcts' (Monte Carlo tree search, caro_mcts.py)
+    'ai_mcts_batch': 16,  # random playouts per MCTS leaf
+    'ai_mcts_iterations': 0  # MCTS leaves per move, 0 = only the time budget limits the search
+}
+
+
+def load_settings(path='caro_settings.json'):
+    settings = dict(DEFAULT_SETTINGS)
+    try:
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                settings.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+    return settings
+
+
+def other_player(player):
+    return 'O' if player == 'X' else 'X'
+
+
+# ===== SYMMETRY =====
+_symmetry_cache = {}
+
+
+def symmetry_maps(size):
+    # maps[s][row][col] is where (row, col) goes under symmetry s: s & 3 counts
+    # quarter turns and s & 4 mirrors left-right first, giving all 8 of a square
+    if size not in _symmetry_cache:
+        n = size - 1
+        maps = []
+        for symmetry in range(8):
+            grid = []
+            for row in range(size):
+                cells = []
+                for col in range(size):
+                    r, c = row, (n - col if symmetry & 4 else col)
+                    for _ in range(symmetry & 3):
+                        r, c = c, n - r
+                    cells.append((r, c))
+                grid.append(cells)
+            maps.append(grid)
+        inverses = []
+        for grid in maps:
+            inverse = [[None] * size for _ in range(size)]
+            for row in range(size):
+                for col in range(size):
+                    r, c = grid[row][col]
+                    inverse[r][c] = (row, col)
+            inverses.append(inverse)
+        _symmetry_cache[size] = (maps, inverses)
+    return _symmetry_cache[size]
+
+
+def canonical_hash(board):
+    # Smallest Zobrist hash over the 8 symmetric images of the board, and the
+    # symmetry that produced it (to map moves into and out of that frame)
+    size = len(board)
+    zobrist = CaroAI.zobrist_keys(size)
+    maps, _ = symmetry_maps(size)
+    stones = [(row, col, player) for row, cells in enumerate(board) for col, player in enumerate(cells) if player]
+    best = None
+    for symmetry, grid in enumerate(maps):
+        key = 0
+        for row, col, player in stones:
+            r, c = grid[row][col]
+            key ^= zobrist[player][r][c]
+        if best is None or key < best[0]:
+            best = (key, symmetry)
+    return best
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class BitBoard:
+    # One Python int per player. Cell (row, col) is bit row * (size + 1) + col;
+    # the spare column per row stays empty so shifted lines never wrap around.
+    # A player has won when some bit survives win_condition - 1 shift-and-ANDs
+    # along one of the four directions, with no side effects on the caller.
+    # Under the exact rule a surviving run start also needs both neighbouring
+    # cells along the line free of the player's stones, so overlines do not win.
+    def __init__(self, size, win_condition, exact=False):
+        self.size = size
+        self.win_condition = win_condition
+        self.exact = exact
+        self.stride = size + 1
+        self.bits = {'X': 0, 'O': 0}
+        self.cell_bits = [[1 << (row * self.stride + col) for col in range(size)] for row in range(size)]
+        self.full_mask = sum(sum(row) for row in self.cell_bits)
+        self.directions = [
+            (1, (0, 1)),
+            (self.stride, (1, 0)),
+            (self.stride + 1, (1, 1)),
+            (self.stride - 1, (1, -1))
+        ]
+        # Doubling plan: runs of length 1, 2, 4, ... until win_condition is covered
+        self.steps = []
+        run = 1
+        while run < win_condition:
+            step = min(run, win_condition - run)
+            self.steps.append(step)
+            run += step
+        self.shift_plans = [[shift * step for step in self.steps] for shift, _ in self.directions]
+
+    @classmethod
+    def from_board(cls, board, win_condition, exact=False):
+        bitboard = cls(len(board), win_condition, exact)
+        for row, cells in enumerate(board):
+            for col, player in enumerate(cells):
+                if player != '':
+                    bitboard.place(row, col, player)
+        return bitboard
+
+    def place(self, row, col, player):
+        self.bits[player] |= self.cell_bits[row][col]
+
+    def remove(self, row, col, player):
+        self.bits[player] &= ~self.cell_bits[row][col]
+
+    def is_empty(self, row, col):
+        return not (self.bits['X'] | self.bits['O']) & self.cell_bits[row][col]
+
+    def is_full(self):
+        return (self.bits['X'] | self.bits['O']) == self.full_mask
+
+    def is_win(self, player):
+        bits = self.bits[player]
+        for plan, (shift, _) in zip(self.shift_plans, self.directions):
+            runs = bits
+            for step in plan:
+                runs &= runs >> step
+                if not runs:
+                    break
+            else:
+                if not self.exact or self.exact_runs(bits, runs, shift):
+                    return True
+        return False
+
+    def exact_runs(self, bits, runs, shift):
+        # Run starts whose cell before and cell after the run are not the player's.
+        # The spare column keeps both neighbours of an edge run empty.
+        return runs & ~(bits << shift) & ~(bits >> (shift * self.win_condition))
+
+    def winning_cells(self, player):
+        # Cells of every winning run, for highlighting
+        bits = self.bits[player]
+        cells = set()
+        for plan, (shift, (dr, dc)) in zip(self.shift_plans, self.directions):
+            runs = bits
+            for step in plan:
+                runs &= runs >> step
+            if self.exact:
+                runs = self.exact_runs(bits, runs, shift)
+            while runs:
+                low = runs & -runs
+                index = low.bit_length() - 1
+                row, col = divmod(index, self.stride)
+                cells.update((row + i * dr, col + i * dc) for i in range(self.win_condition))
+                runs ^= low
+        return sorted(cells)
+
+
+class TranspositionTable:
+    # Fixed-size two-tier table: every bucket keeps a depth-preferred slot and an
+    # always-replace slot, so memory stays bounded however long the session runs.
+    EXACT, LOWER, UPPER = 0, 1, 2
+    ENTRY_BYTES = 160  # rough cost of one stored entry tuple
+
+    def __init__(self, size_mb=16):
+        buckets = max(1, int(size_mb * 1024 * 1024) // (2 * self.ENTRY_BYTES))
+        self.bucket_count = 1 << (buckets.bit_length() - 1)
+        self.mask = self.bucket_count - 1
+        self.size_mb = size_mb
+        self.clear()
+
+    def clear(self):
+        self.deep = [None] * self.bucket_count
+        self.recent = [None] * self.bucket_count
+        self.generation = 0
+
+    def new_search(self):
+        # Entries from older searches lose their claim on the depth-preferred slot
+        self.generation += 1
+
+    def probe(self, key):
+        index = key & self.mask
+        entry = self.deep[index]
+        if entry is not None and entry[0] == key:
+            return entry
+        entry = self.recent[index]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, depth, flag, score, move):
+        index = key & self.mask
+        entry = (key, depth, flag, score, move, self.generation)
+        deep = self.deep[index]
+        if deep is None or deep[0] == key or depth >= deep[1] or deep[5] != self.generation:
+            self.deep[index] = entry
+        else:
+            self.recent[index] = entry
+
+
+class SearchContext:
+    # What a game's searches learn that stays useful for the next move: the
+    # transposition table plus history and killer move-ordering statistics.
+    # Kept across moves and undos; cleared only when a new game starts.
+    KILLERS = 2  # killer moves remembered per position depth
+    HISTORY_LIMIT = 1 << 16  # history scores stay below this, so they only break ties
+
+    def __init__(self, size, tt_size_mb=16):
+        self.size = size
+        self.tt = TranspositionTable(tt_size_mb)
+        self.clear()
+
+    def clear(self):
+        self.tt.clear()
+        cells = self.size * self.size
+        self.history = {'X': [0] * cells, 'O': [0] * cells}
+        # Indexed by the number of stones on the board, not the distance from the
+        # root, so killers stay with their positions as the game moves on
+        self.killers = [[] for _ in range(cells + 1)]
+
+    def new_search(self):
+        # Older cutoffs count for less, so the ordering follows the game
+        self.tt.new_search()
+        for player, table in self.history.items():
+            self.history[player] = [value >> 1 for value in table]
+
+    def cutoff(self, player, move, depth, stones):
+        row, col = move
+        table = self.history[player]
+        index = row * self.size + col
+        table[index] = min(table[index] + depth * depth, self.HISTORY_LIMIT - 2)
+        killers = self.killers[stones]
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[self.KILLERS:]
+
+
+class PatternEvaluator:
+    # Incremental threat evaluator. Every run of win_condition cells along a line
+    # is a window; a window holding stones of one player only is still "live" for
+    # that player. Live windows are counted per player by how many stones they
+    # hold, and only the windows through a changed cell are touched on
+    # place/remove, so scoring a leaf costs nothing. Shapes are not classified
+    # as open or closed: an open shape simply lies in more live windows than a
+    # closed one (an open four in two, a closed four in one), so it scores more.
+    # Under the exact rule a window is also dead for a player with a stone just
+    # outside either end, since filling it would make an overline.
+    _window_cache = {}
+    _flank_cache = {}
+
+    def __init__(self, size, win_condition, exact=False):
+        self.size = size
+        self.win_condition = win_condition
+        self.exact = exact
+        self.windows, self.cell_windows = self.build_windows(size, win_condition)
+        self.weights = [0] + [10 ** (k - 1) for k in range(1, win_condition + 1)]
+        self.stones = {
+            'X': [0] * len(self.windows),
+            'O': [0] * len(self.windows)
+        }
+        # pattern_counts[player][k]: live windows with k stones of player
+        self.pattern_counts = {
+            'X': [0] * (win_condition + 1),
+            'O': [0] * (win_condition + 1)
+        }
+        self.score = 0
+        if exact:
+            self.window_flanks, self.flank_windows = self.build_flanks(size, win_condition)
+            self.flanks = {'X': [0] * len(self.windows), 'O': [0] * len(self.windows)}
+
+    @classmethod
+    def build_windows(cls, size, win_condition):
+        key = (size, win_condition)
+        if key not in cls._window_cache:
+            windows = []
+            cell_windows = [[[] for _ in range(size)] for _ in range(size)]
+            for row in range(size):
+                for col in range(size):
+                    for dr, dc in CaroAI.DIRECTIONS:
+                        end_row = row + (win_condition - 1) * dr
+                        end_col = col + (win_condition - 1) * dc
+                        if not (0 <= end_row < size and 0 <= end_col < size):
+                            continue
+                        cells = [(row + i * dr, col + i * dc) for i in range(win_condition)]
+                        for r, c in cells:
+                            cell_windows[r][c].append(len(windows))
+                        windows.append(cells)
+            cls._window_cache[key] = (windows, cell_windows)
+        return cls._window_cache[key]
+
+    @classmethod
+    def build_flanks(cls, size, win_condition):
+        # window_flanks[w]: the cells just outside window w along its line;
+        # flank_windows[row][col]: the windows that cell flanks
+        key = (size, win_condition)
+        if key not in cls._flank_cache:
+            windows, _ = cls.build_windows(size, win_condition)
+            window_flanks = []
+            flank_windows = [[[] for _ in range(size)] for _ in range(size)]
+            for w, cells in enumerate(windows):
+                (r0, c0), (r1, c1) = cells[0], cells[1]
+                dr, dc = r1 - r0, c1 - c0
+                flanks = []
+                for row, col in ((r0 - dr, c0 - dc), (cells[-1][0] + dr, cells[-1][1] + dc)):
+                    if 0 <= row < size and 0 <= col < size:
+                        flanks.append((row, col))
+                        flank_windows[row][col].append(w)
+                window_flanks.append(flanks)
+            cls._flank_cache[key] = (window_flanks, flank_windows)
+        return cls._flank_cache[key]
+
+    def window_score(self, w, direction):
+        # Adds (direction 1) or takes away (-1) window w's share of counts and score
+        x, o = self.stones['X'][w], self.stones['O'][w]
+        if x and not o and not self.flanks['X'][w]:
+            self.pattern_counts['X'][x] += direction
+            self.score -= direction * self.weights[x]
+        elif o and not x and not self.flanks['O'][w]:
+            self.pattern_counts['O'][o] += direction
+            self.score += direction * self.weights[o]
+
+    def update_exact(self, row, col, player, delta):
+        affected = self.cell_windows[row][col] + self.flank_windows[row][col]
+        for w in affected:
+            self.window_score(w, -1)
+        own, flanks = self.stones[player], self.flanks[player]
+        for w in self.cell_windows[row][col]:
+            own[w] += delta
+        for w in self.flank_windows[row][col]:
+            flanks[w] += delta
+        for w in affected:
+            self.window_score(w, 1)
+
+    def place(self, row, col, player):
+        if self.exact:
+            self.update_exact(row, col, player, 1)
+            return
+        opponent = 'X' if player == 'O' else 'O'
+        own, other = self.stones[player], self.stones[opponent]
+        own_counts, other_counts = self.pattern_counts[player], self.pattern_counts[opponent]
+        sign = 1 if player == 'O' else -1
+        for w in self.cell_windows[row][col]:
+            k = own[w]
+            if other[w] == 0:
+                if k:
+                    own_counts[k] -= 1
+                own_counts[k + 1] += 1
+                self.score += sign * (self.weights[k + 1] - self.weights[k])
+            elif k == 0:
+                # The opponent's window is blocked from now on
+                other_counts[other[w]] -= 1
+                self.score += sign * self.weights[other[w]]
+            own[w] = k + 1
+
+    def remove(self, row, col, player):
+        if self.exact:
+            self.update_exact(row, col, player, -1)
+            return
+        opponent = 'X' if player == 'O' else 'O'
+        own, other = self.stones[player], self.stones[opponent]
+        own_counts, other_counts = self.pattern_counts[player], self.pattern_counts[opponent]
+        sign = 1 if player == 'O' else -1
+        for w in self.cell_windows[row][col]:
+            k = own[w] - 1
+            own[w] = k
+            if other[w] == 0:
+                own_counts[k + 1] -= 1
+                if k:
+                    own_counts[k] += 1
+                self.score -= sign * (self.weights[k + 1] - self.weights[k])
+            elif k == 0:
+                other_counts[other[w]] += 1
+                self.score -= sign * self.weights[other[w]]
+
+    def move_score(self, row, col):
+        # Threat value of an empty cell: what a stone there builds for either side
+        score = 0
+        x_stones, o_stones = self.stones['X'], self.stones['O']
+        for w in self.cell_windows[row][col]:
+            if x_stones[w] == 0:
+                score += self.weights[o_stones[w] + 1]
+            if o_stones[w] == 0:
+                score += self.weights[x_stones[w] + 1]
+        return score
+
+
+class CandidateMoves:
+    # Empty cells within `radius` of at least one stone, kept up to date on
+    # place/remove instead of rescanning the board for every move list.
+    _neighbour_cache = {}
+
+    def __init__(self, size, radius=2):
+        self.size = size
+        self.radius = radius
+        self.neighbours = self.build_neighbours(size, radius)
+        self.near = [[0] * size for _ in range(size)]
+        self.occupied = [[False] * size for _ in range(size)]
+        self.cells = set()
+        self.stone_count = 0
+
+    @classmethod
+    def build_neighbours(cls, size, radius):
+        key = (size, radius)
+        if key not in cls._neighbour_cache:
+            cls._neighbour_cache[key] = [
+                [[(row + dr, col + dc)
+                  for dr in range(-radius, radius + 1)
+                  for dc in range(-radius, radius + 1)
+                  if (dr or dc) and 0 <= row + dr < size and 0 <= col + dc < size]
+                 for col in range(size)]
+                for row in range(size)
+            ]
+        return cls._neighbour_cache[key]
+
+    def place(self, row, col):
+        self.occupied[row][col] = True
+        self.stone_count += 1
+        self.cells.discard((row, col))
+        for r, c in self.neighbours[row][col]:
+            self.near[r][c] += 1
+            if self.near[r][c] == 1 and not self.occupied[r][c]:
+                self.cells.add((r, c))
+
+    def remove(self, row, col):
+        self.occupied[row][col] = False
+        self.stone_count -= 1
+        for r, c in self.neighbours[row][col]:
+            self.near[r][c] -= 1
+            if self.near[r][c] == 0:
+                self.cells.discard((r, c))
+        if self.near[row][col]:
+            self.cells.add((row, col))
+
+    def moves(self):
+        if self.stone_count == 0:
+            center = self.size // 2
+            return [(center, center)]
+        return sorted(self.cells)
+
+
+class CaroAI:
+    # Alpha-beta search with iterative deepening and a per-move time budget.
+    # Works on its own copy of the board so the game state is never touched.
+    WIN_SCORE = 10 ** 9
+    DIRECTIONS = [(0, 1), (1, 0), (1, 1), (1, -1)]
+    CHECK_EVERY = 64  # nodes between two deadline checks, small enough to stop within ~5 ms on 19x19
+    _zobrist_cache = {}
+
+    def __init__(self, board, win_condition, time_limit_ms=1000, max_depth=32, tt=None,
+                 candidate_radius=2, order_moves=True, cancel_event=None, symmetry=True, on_iteration=None,
+                 exact=False, context=None):
+        self.board = [row[:] for row in board]
+        self.size = len(board)
+        self.win_condition = win_condition
+        self.time_limit_ms = time_limit_ms
+        self.max_depth = max_depth
+        self.context = context  # SearchContext shared by the game's searches, replaces tt
+        self.tt = context.tt if context is not None else tt
+        self.order_moves = order_moves
+        self.cancel_event = cancel_event
+        self.on_iteration = on_iteration  # called from the searching thread after every finished depth
+        self.deadline = None
+        self.nodes = 0
+        self.partial_result = None
+        self.iterations = []
+
+        # One Zobrist hash per symmetric image of the board (just the identity
+        # when symmetry is off). The smallest is the position's canonical key.
+        self.symmetry_maps, self.symmetry_inverses = symmetry_maps(self.size)
+        self.cell_keys = self.symmetric_zobrist_keys(self.size, 8 if symmetry else 1)
+        self.hashes = [0] * (8 if symmetry else 1)
+        self.exact = exact
+        self.bitboard = BitBoard(self.size, win_condition, exact)
+        self.evaluator = PatternEvaluator(self.size, win_condition, exact)
+        self.candidates = CandidateMoves(self.size, candidate_radius)
+        for row in range(self.size):
+            for col in range(self.size):
+                player = self.board[row][col]
+                if player != '':
+                    self.hashes = [h ^ k for h, k in zip(self.hashes, self.cell_keys[player][row][col])]
+                    self.bitboard.place(row, col, player)
+                    self.evaluator.place(row, col, player)
+                    self.candidates.place(row, col)
+
+    @classmethod
+    def zobrist_keys(cls, size):
+        # Fixed seed per board size so hashes stay valid across searches sharing a table
+        if size not in cls._zobrist_cache:
+            rng = random.Random(size)
+            cls._zobrist_cache[size] = {
+                player: [[rng.getrandbits(64) for _ in range(size)] for _ in range(size)]
+                for player in ('X', 'O')
+            }
+        return cls._zobrist_cache[size]
+
+    @classmethod
+    def symmetric_zobrist_keys(cls, size, count):
+        # keys[player][row][col][s]: the key of the cell (row, col) lands on under symmetry s
+        key = (size, count)
+        if key not in cls._zobrist_cache:
+            zobrist = cls.zobrist_keys(size)
+            maps, _ = symmetry_maps(size)
+            cls._zobrist_cache[key] = {
+                player: [[tuple(zobrist[player][maps[s][row][col][0]][maps[s][row][col][1]] for s in range(count))
+                          for col in range(size)] for row in range(size)]
+                for player in ('X', 'O')
+            }
+        return cls._zobrist_cache[key]
+
+    def position_key(self):
+        # Canonical TT key and the symmetry that maps this board onto that image
+        key = min(self.hashes)
+        return key, self.hashes.index(key)
+
+    def move_to_key_frame(self, move, symmetry):
+        return self.symmetry_maps[symmetry][move[0]][move[1]] if move else None
+
+    def move_from_key_frame(self, move, symmetry):
+        return self.symmetry_inverses[symmetry][move[0]][move[1]] if move else None
+
+    def prune_symmetric_moves(self, moves):
+        # If the board is its own mirror image, moves that are images of each
+        # other lead to equivalent positions; keep the first of every such group
+        symmetries = [s for s in range(1, len(self.hashes)) if self.hashes[s] == self.hashes[0]]
+        if not symmetries:
+            return moves
+        seen = set()
+        unique = []
+        for move in moves:
+            if move in seen:
+                continue
+            unique.append(move)
+            seen.update(self.symmetry_maps[s][move[0]][move[1]] for s in symmetries)
+        return unique
+
+    def place(self, row, col, player):
+        self.board[row][col] = player
+        self.hashes = [h ^ k for h, k in zip(self.hashes, self.cell_keys[player][row][col])]
+        self.bitboard.place(row, col, player)
+        self.evaluator.place(row, col, player)
+        self.candidates.place(row, col)
+
+    def remove(self, row, col):
+        player = self.board[row][col]
+        self.hashes = [h ^ k for h, k in zip(self.hashes, self.cell_keys[player][row][col])]
+        self.bitboard.remove(row, col, player)
+        self.evaluator.remove(row, col, player)
+        self.candidates.remove(row, col)
+        self.board[row][col] = ''
+
+    # ===== SEARCH =====
+    def search(self, player, root_moves=None):
+        # Returns (move, score, depth) for the best move found within the time budget.
+        # root_moves restricts the root to a subset, as used by the parallel search.
+        if root_moves is not None:
+            moves = list(root_moves)
+        else:
+            moves = self.prune_symmetric_moves(self.get_available_moves(player))
+        self.iterations = []
+        if not moves:
+            return None, 0, 0
+
+        started = time.perf_counter()
+        self.deadline = started + self.time_limit_ms / 1000.0
+        self.nodes = 0
+        if self.context is not None:
+            self.context.new_search()
+        elif self.tt is not None:
+            self.tt.new_search()
+        best_move, best_score, best_depth = moves[0], 0, 0
+        empty_cells = self.size * self.size - self.candidates.stone_count
+
+        for depth in range(1, min(self.max_depth, empty_cells) + 1):
+            # Search the previous best move first so a partial iteration is still usable
+            moves.remove(best_move)
+            moves.insert(0, best_move)
+            self.partial_result = None
+            try:
+                move, score = self.search_root(player, moves, depth, root_moves is not None)
+            except SearchTimeout:
+                if self.partial_result:
+                    best_move, best_score = self.partial_result
+                break
+            best_move, best_score, best_depth = move, score, depth
+            # (depth, move, score, nodes so far, seconds so far) per completed iteration
+            self.iterations.append((depth, move, score, self.nodes, time.perf_counter() - started))
+            if self.on_iteration is not None:
+                self.on_iteration(self.iteration_info(player, self.iterations[-1]))
+            if abs(score) >= self.WIN_SCORE - self.max_depth:
+                break
+
+        return best_move, best_score, best_depth
+
+    def analyse(self, player, on_update=None):
+        # Scores every candidate move, one depth at a time, until the time budget
+        # or max_depth runs out. Moves within ANALYSIS_MARGIN of the best get an
+        # exact score; worse ones only an upper bound, which is enough to rank
+        # them below. on_update gets a result after every scored move:
+        # {'depth', 'complete', 'scores': {move: score}, 'lines': [(move, score,
+        # pv)] best first, 'nodes', 'time'}, where scores mixes the depth in
+        # progress with the previous one and lines is from the last complete
+        # depth. Returns the last complete result, or None.
+        moves = self.get_available_moves(player)
+        started = time.perf_counter()
+        self.deadline = started + self.time_limit_ms / 1000.0
+        self.nodes = 0
+        if self.context is not None:
+            self.context.new_search()
+        elif self.tt is not None:
+            self.tt.new_search()
+        opponent = other_player(player)
+        margin = 10 ** max(0, self.win_condition - 2)
+        empty_cells = self.size * self.size - self.candidates.stone_count
+        scores, lines, result = {}, [], None
+
+        for depth in range(1, min(self.max_depth, empty_cells) + 1):
+            best = -float('inf')
+            try:
+                for row, col in moves:
+                    self.place(row, col, player)
+                    try:
+                        if self.bitboard.is_win(player):
+                            score = self.WIN_SCORE
+                        else:
+                            score = -self.alphabeta(opponent, depth - 1, -float('inf'), -(best - margin), 1)
+                    finally:
+                        self.remove(row, col)
+                    best = max(best, score)
+                    scores[(row, col)] = score
+                    if on_update is not None:
+                        on_update({'depth': depth, 'complete': False, 'scores': dict(scores), 'lines': lines,
+                                   'nodes': self.nodes, 'time': time.perf_counter() - started})
+            except SearchTimeout:
+                break
+            moves.sort(key=lambda m: scores[m], reverse=True)
+            lines = [(move, scores[move], self.principal_variation(player, move, depth)) for move in moves]
+            result = {'depth': depth, 'complete': True, 'scores': dict(scores), 'lines': lines,
+                      'nodes': self.nodes, 'time': time.perf_counter() - started}
+            if on_update is not None:
+                on_update(result)
+            if abs(scores[moves[0]]) >= self.WIN_SCORE - self.max_depth:
+                break
+        return result
+
+    def iteration_info(self, player, iteration):
+        depth, move, score, nodes, seconds = iteration
+        return {
+            'depth': depth,
+            'move': move,
+            'score': score,
+            'nodes': nodes,
+            'time': seconds,
+            'nps': nodes / seconds if seconds else 0.0,
+            'pv': self.principal_variation(player, move, depth)
+        }
+
+    def principal_variation(self, player, move, length=32):
+        # Expected line from the root: the best move, then the stored best reply
+        # of every following position for as long as the table remembers one
+        if move is None:
+            return []
+        line = []
+        while move is not None and len(line) < length:
+            row, col = move
+            if not (0 <= row < self.size and 0 <= col < self.size) or self.board[row][col] != '':
+                break
+            self.place(row, col, player)
+            line.append(move)
+            if self.bitboard.is_win(player) or self.tt is None:
+                break
+            key, symmetry = self.position_key()
+            entry = self.tt.probe(key)
+            move = self.move_from_key_frame(entry[4], symmetry) if entry else None
+            player = 'X' if player == 'O' else 'O'
+        for row, col in reversed(line):
+            self.remove(row, col)
+        return line
+
+    def search_root(self, player, moves, depth, partial=False):
+        # partial: moves is only a subset of the root moves, so the best of
+        # them is a lower bound on the position's value, not its value
+        opponent = 'X' if player == 'O' else 'O'
+        alpha, beta = -float('inf'), float('inf')
+        best_move = moves[0]
+
+        for row, col in moves:
+            self.place(row, col, player)
+            try:
+                if self.bitboard.is_win(player):
+                    score = self.WIN_SCORE
+                else:
+                    score = -self.alphabeta(opponent, depth - 1, -beta, -alpha, 1)
+            finally:
+                self.remove(row, col)
+
+            if score > alpha:
+                alpha = score
+                best_move = (row, col)
+            self.partial_result = (best_move, alpha)
+
+        if self.tt is not None:
+            key, symmetry = self.position_key()
+            flag = TranspositionTable.LOWER if partial else TranspositionTable.EXACT
+            self.tt.store(key, depth, flag, alpha, self.move_to_key_frame(best_move, symmetry))
+        return best_move, alpha
+
+    def alphabeta(self, player, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes % self.CHECK_EVERY == 0 and self.out_of_time():
+            raise SearchTimeout()
+
+        alpha_orig = alpha
+        hash_move = None
+        if self.tt is not None:
+            key, symmetry = self.position_key()
+            entry = self.tt.probe(key)
+            if entry is not None:
+                _, entry_depth, flag, entry_score, hash_move, _ = entry
+                hash_move = self.move_from_key_frame(hash_move, symmetry)
+                if entry_depth >= depth:
+                    score = self.score_from_tt(entry_score, ply)
+                    if flag == TranspositionTable.EXACT:
+                        return score
+                    if flag == TranspositionTable.LOWER:
+                        alpha = max(alpha, score)
+                    else:
+                        beta = min(beta, score)
+                    if alpha >= beta:
+                        return score
+
+        if depth == 0:
+            score = self.evaluate_board()
+            score = score if player == 'O' else -score
+            if self.tt is not None:
+                self.tt.store(key, 0, TranspositionTable.EXACT, score, None)
+            return score
+
+        stones = self.candidates.stone_count
+        # Above the last ply the game's history and killers break ties between
+        # equally threatening moves; at the last ply the sort is kept cheap
+        moves = self.get_available_moves(player, stones) if depth > 1 else self.get_available_moves()
+        if not moves:
+            return 0
+        if hash_move in moves:
+            moves.remove(hash_move)
+            moves.insert(0, hash_move)
+
+        opponent = 'X' if player == 'O' else 'O'
+        best_score = -float('inf')
+        best_move = None
+        for row, col in moves:
+            self.place(row, col, player)
+            try:
+                if self.bitboard.is_win(player):
+                    # Prefer the quickest win and the slowest loss
+                    score = self.WIN_SCORE - ply
+                else:
+                    score = -self.alphabeta(opponent, depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                self.remove(row, col)
+
+            if score > best_score:
+                best_score = score
+                best_move = (row, col)
+            if best_score > alpha:
+                alpha = best_score
+            if alpha >= beta:
+                if self.context is not None:
+                    self.context.cutoff(player, best_move, depth, stones)
+                break
+
+        if self.tt is not None:
+            if best_score <= alpha_orig:
+                flag = TranspositionTable.UPPER
+            elif best_score >= beta:
+                flag = TranspositionTable.LOWER
+            else:
+                flag = TranspositionTable.EXACT
+            self.tt.store(key, depth, flag, self.score_to_tt(best_score, ply),
+                          self.move_to_key_frame(best_move, symmetry))
+        return best_score
+
+    def out_of_time(self):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            return True
+        return time.perf_counter() > self.deadline
+
+    def score_to_tt(self, score, ply):
+        # Win scores are stored relative to the node, not the root
+        if score >= self.WIN_SCORE - 1000:
+            return score + ply
+        if score <= -self.WIN_SCORE + 1000:
+            return score - ply
+        return score
+
+    def score_from_tt(self, score, ply):
+        if score >= self.WIN_SCORE - 1000:
+            return score - ply
+        if score <= -self.WIN_SCORE + 1000:
+            return score + ply
+        return score
+
+    # ===== EVALUATION =====
+    def evaluate_board(self):
+        # Positive scores favour O (the AI), negative scores favour X
+        return self.evaluator.score
+
+    # ===== MOVE GENERATION =====
+    def get_available_moves(self, player=None, stones=None):
+        moves = self.candidates.moves()
+        if self.order_moves:
+            # Strongest threats first so alpha-beta cuts off early; equal threats
+            # killers first, then by how often the move caused a cutoff this game
+            move_score = self.evaluator.move_score
+            if player is not None and self.context is not None:
+                history = self.context.history[player]
+                killers = self.context.killers[stones] if stones is not None else ()
+                limit = SearchContext.HISTORY_LIMIT
+                size = self.size
+                moves.sort(key=lambda m: move_score(m[0], m[1]) * limit
+                           + (limit - 1 if m in killers else history[m[0] * size + m[1]]), reverse=True)
+            else:
+                moves.sort(key=lambda m: move_score(m[0], m[1]), reverse=True)
+        return moves
+
+
+_worker_tables = {}
+
+
+def search_root_moves(board, win_condition, player, root_moves, time_limit_ms, tt_size_mb, candidate_radius,
+                      exact=False):
+    # Runs inside a worker process; each process keeps its own transposition table
+    key = (len(board), win_condition, exact, tt_size_mb)
+    if key not in _worker_tables:
+        _worker_tables.clear()
+        _worker_tables[key] = TranspositionTable(tt_size_mb)
+    # The parent's table never sees this search, so the lines are read here,
+    # one per finished depth
+    pvs = []
+    ai = CaroAI(board, win_condition, time_limit_ms=time_limit_ms, tt=_worker_tables[key],
+                candidate_radius=candidate_radius, exact=exact, on_iteration=lambda info: pvs.append(info['pv']))
+    move, score, depth = ai.search(player, root_moves)
+    return ai.iterations, pvs, (move, score, ai.principal_variation(player, move, max(1, depth))), ai.nodes
+
+
+class ParallelSearch:
+    # Root split: the ordered root moves are dealt round-robin to worker
+    # processes, each runs iterative deepening on its share, and the answer is
+    # the best move at the deepest iteration every worker completed. nodes and
+    # pv describe the last search.
+    def __init__(self, workers, tt_size_mb=16):
+        self.workers = workers
+        self.tt_size_mb = tt_size_mb
+        self.executor = None
+        self.nodes = 0
+        self.pv = []
+
+    def search(self, ai, player, cancel_event=None):
+        moves = ai.prune_symmetric_moves(ai.get_available_moves())
+        self.nodes = 0
+        self.pv = []
+        if self.workers < 2 or len(moves) < 2:
+            move, score, depth = ai.search(player)
+            self.nodes = ai.nodes
+            self.pv = ai.principal_variation(player, move, depth)
+            return move, score, depth
+        # Imported here so headless startup does not pay for multiprocessing
+        from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+
+        chunks = [moves[i::self.workers] for i in range(self.workers)]
+        futures = [
+            self.executor.submit(search_root_moves, ai.board, ai.win_condition, player, chunk,
+                                 ai.time_limit_ms, self.tt_size_mb, ai.candidates.radius, ai.exact)
+            for chunk in chunks if chunk
+        ]
+        pending = set(futures)
+        while pending:
+            # Workers stop on their own deadline; a cancelled search just stops waiting
+            done, pending = wait(pending, timeout=0.05, return_when=FIRST_COMPLETED)
+            if cancel_event is not None and cancel_event.is_set():
+                return None, 0, 0
+
+        results = [future.result() for future in futures]
+        self.nodes = sum(nodes for _, _, _, nodes in results)
+        depth = min(iterations[-1][0] if iterations else 0 for iterations, _, _, _ in results)
+        candidates = []
+        for iterations, pvs, partial, _ in results:
+            if depth:
+                move, score = iterations[depth - 1][1:3]
+                pv = pvs[depth - 1]
+            else:
+                move, score, pv = partial
+            candidates.append((score, move, pv))
+        score, move, self.pv = max(candidates, key=lambda c: c[0])
+        return move, score, depth
+
+    def shutdown(self, wait=False):
+        # wait=True also joins the worker processes, which a script should do
+        # before exiting: an executor still closing down at interpreter exit
+        # can fail with "Bad file descriptor"
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait, cancel_futures=True)
+            self.executor = None
+
+
+class ThreatSearch:
+    # VCF (victory by continuous fours): the attacker only plays moves that
+    # threaten to win next move, so every defender reply is forced and the tree
+    # stays narrow enough to read long combinations on big boards. A "four" here
+    # is any window one stone short of win_condition with no enemy stone in it
+    # (and, under the exact rule, no own stone just outside it).
+    def __init__(self, board, win_condition, max_nodes=20000, max_depth=16, exact=False, cancel_event=None):
+        self.size = len(board)
+        self.win_condition = win_condition
+        self.exact = exact
+        self.cancel_event = cancel_event
+        self.board = [row[:] for row in board]
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+        self.windows, self.cell_windows = PatternEvaluator.build_windows(self.size, win_condition)
+        if exact:
+            self.window_flanks, flank_windows = PatternEvaluator.build_flanks(self.size, win_condition)
+            # A stone changes the windows it lies in and the windows it flanks
+            self.touched = [[self.cell_windows[row][col] + flank_windows[row][col] for col in range(self.size)]
+                            for row in range(self.size)]
+        else:
+            self.touched = self.cell_windows
+        self.stones = {'X': [0] * len(self.windows), 'O': [0] * len(self.windows)}
+        # live[player][k]: windows holding k stones of player and none of the opponent
+        self.live = {player: [set() for _ in range(win_condition + 1)] for player in ('X', 'O')}
+        self.zobrist = CaroAI.zobrist_keys(self.size)
+        self.hash = 0
+        self.failed = {}
+        self.nodes = 0
+        for row in range(self.size):
+            for col in range(self.size):
+                if board[row][col]:
+                    self.board[row][col] = ''
+                    self.place(row, col, board[row][col])
+
+    def classify(self, w, add):
+        x, o = self.stones['X'][w], self.stones['O'][w]
+        if x and not o:
+            player, count = 'X', x
+        elif o and not x:
+            player, count = 'O', o
+        else:
+            return
+        if self.exact and any(self.board[row][col] == player for row, col in self.window_flanks[w]):
+            return
+        live = self.live[player][count]
+        if add:
+            live.add(w)
+        else:
+            live.discard(w)
+
+    def place(self, row, col, player):
+        self.update(row, col, player, player, 1)
+
+    def remove(self, row, col, player):
+        self.update(row, col, player, '', -1)
+
+    def update(self, row, col, player, cell, delta):
+        touched = self.touched[row][col]
+        for w in touched:
+            self.classify(w, False)
+        self.board[row][col] = cell
+        self.hash ^= self.zobrist[player][row][col]
+        stones = self.stones[player]
+        for w in self.cell_windows[row][col]:
+            stones[w] += delta
+        for w in touched:
+            self.classify(w, True)
+
+    def empty_cells(self, windows):
+        board = self.board
+        return {(row, col) for w in windows for row, col in self.windows[w] if board[row][col] == ''}
+
+    def winning_cells(self, player):
+        return self.empty_cells(self.live[player][self.win_condition - 1])
+
+    def four_moves(self, player):
+        # Cells that make at least one four, those making several first
+        counts = {}
+        board = self.board
+        for w in self.live[player][self.win_condition - 2]:
+            for row, col in self.windows[w]:
+                if board[row][col] == '':
+                    counts[(row, col)] = counts.get((row, col), 0) + 1
+        return sorted(counts, key=lambda cell: (-counts[cell], cell))
+
+    def vcf(self, attacker, depth=None):
+        # Forced win for attacker as [attacker move, reply, attacker move, ...],
+        # or None when none is found within the depth and node budget
+        if depth is None:
+            depth = self.max_depth
+        wins = self.winning_cells(attacker)
+        if wins:
+            return [min(wins)]
+        if depth == 0 or self.stopped():
+            return None
+        if self.failed.get(self.hash, -1) >= depth:
+            return None
+        self.nodes += 1
+
+        defender = other_player(attacker)
+        blocks = self.winning_cells(defender)
+        if len(blocks) > 1:
+            return None
+        moves = self.four_moves(attacker)
+        if blocks:
+            # The defender threatens to win: only a four on the blocking cell keeps the initiative
+            moves = [move for move in moves if move in blocks]
+
+        for row, col in moves:
+            self.place(row, col, attacker)
+            threats = self.winning_cells(attacker)
+            line = None
+            if len(threats) > 1:
+                line = [(row, col)]
+            elif threats:
+                reply = threats.pop()
+                self.place(reply[0], reply[1], defender)
+                rest = self.vcf(attacker, depth - 1)
+                self.remove(reply[0], reply[1], defender)
+                if rest is not None:
+                    line = [(row, col), reply] + rest
+            self.remove(row, col, attacker)
+            if line is not None:
+                return line
+        self.failed[self.hash] = depth
+        return None
+
+    def stopped(self):
+        # Out of nodes, or the search this runs for was cancelled
+        return self.nodes >= self.max_nodes or (self.cancel_event is not None and self.cancel_event.is_set())
+
+    def defences(self, player, line):
+        # Moves for player after which the opponent's forced win `line` no longer
+        # works: stones on the line or in the windows it builds its fours from,
+        # or fours of our own that take the initiative
+        opponent = other_player(player)
+        shapes = self.empty_cells(self.live[opponent][self.win_condition - 2])
+        candidates = list(dict.fromkeys(line + sorted(shapes) + self.four_moves(player)))
+        refutations = []
+        for row, col in candidates:
+            if self.board[row][col] != '':
+                continue
+            self.place(row, col, player)
+            self.failed = {}
+            self.nodes = 0
+            # Running out of nodes proves nothing
+            refuted = self.vcf(opponent) is None and not self.stopped()
+            self.remove(row, col, player)
+            if refuted:
+                refutations.append((row, col))
+        return refutations
+
+
+class CaroGame:
+    # Headless game: board, move history, rules and the AI players. The settings
+    # dict is shared, not copied, so the GUI's settings screen applies directly.
+    def __init__(self, settings=None):
+        self.settings = settings if settings is not None else dict(DEFAULT_SETTINGS)
+        for key, value in DEFAULT_SETTINGS.items():
+            self.settings.setdefault(key, value)
+        self.search_context = None
+        self.search_context_key = None
+        self.parallel_search = None
+        self.opening_book = None
+        self.opening_book_key = None
+        self.solved_table = None
+        self.solved_table_key = None
+        self.analysis_cache = None
+        self.mcts = None
+        self.mcts_key = None
+        self.last_search = None
+        self.reset()
+
+    def reset(self):
+        self.size = self.settings['board_size']
+        self.win_condition = self.settings['win_condition']
+        self.board = [['' for _ in range(self.size)] for _ in range(self.size)]
+        self.current_player = 'X'
+        self.move_history = []
+        self.winner = None
+        self.candidate_moves = CandidateMoves(self.size, self.settings['ai_candidate_radius'])
+        self.exact = self.settings['win_rule'] == 'exact'
+        self.bitboard = BitBoard(self.size, self.win_condition, self.exact)
+
+    def new_game(self):
+        # reset() keeps what earlier searches learnt, for replaying positions of
+        # the same game; a new game also starts the search context afresh
+        self.reset()
+        if self.search_context is not None:
+            self.search_context.clear()
+        self.mcts = None
+
+    # ===== RULES =====
+    def is_legal(self, row, col):
+        return (self.winner is None and 0 <= row < self.size and 0 <= col < self.size
+                and self.board[row][col] == '')
+
+    def play(self, row, col):
+        # Returns 'win', 'draw' or None; legality is the caller's job (see is_legal)
+        player = self.current_player
+        self.board[row][col] = player
+        self.move_history.append((row, col, player))
+        self.candidate_moves.place(row, col)
+        self.bitboard.place(row, col, player)
+
+        if self.bitboard.is_win(player):
+            self.winner = player
+            return 'win'
+        if self.bitboard.is_full():
+            return 'draw'
+        self.current_player = other_player(player)
+        return None
+
+    def undo(self):
+        row, col, player = self.move_history.pop()
+        self.board[row][col] = ''
+        self.candidate_moves.remove(row, col)
+        self.bitboard.remove(row, col, player)
+        self.current_player = player
+        self.winner = None
+        return row, col, player
+
+    def winning_cells(self):
+        return self.bitboard.winning_cells(self.winner) if self.winner else []
+
+    def get_available_moves(self):
+        return [(row, col) for row in range(self.size) for col in range(self.size)
+                if self.board[row][col] == '']
+
+    def find_winning_move(self, player):
+        # A winning cell always touches a stone, so the candidate set is enough
+        for row, col in self.candidate_moves.moves():
+            self.bitboard.place(row, col, player)
+            won = self.bitboard.is_win(player)
+            self.bitboard.remove(row, col, player)
+            if won:
+                return (row, col)
+        return None
+
+    # ===== AI PLAYERS =====
+    def best_move(self, difficulty=None):
+        difficulty = difficulty or self.settings['ai_difficulty']
+        if difficulty == 'easy':
+            return self.get_random_move()
+        if difficulty == 'medium':
+            return self.get_medium_ai_move()
+        return self.get_hard_ai_move()
+
+    def get_random_move(self):
+        moves = self.candidate_moves.moves() or self.get_available_moves()
+        return random.choice(moves) if moves else None
+
+    def get_medium_ai_move(self):
+        player = self.current_player
+        # Win if possible, otherwise block the opponent's winning move
+        move = self.find_winning_move(player) or self.find_winning_move(other_player(player))
+        if move:
+            return move
+
+        # Take center if available
+        center = self.size // 2
+        if self.board[center][center] == '':
+            return (center, center)
+
+        return self.get_random_move()
+
+    def get_hard_ai_move(self):
+        return self.quick_move() or self.minimax_move()
+
+    def quick_move(self):
+        # Immediate wins, blocks and table lookups are cheap and leave the time
+        # budget for real search. Recorded in last_search like a searched move.
+        player = self.current_player
+        started = time.perf_counter()
+        score = depth = 0
+        move, source = self.find_winning_move(player), 'win'
+        if not move:
+            move, source = self.find_winning_move(other_player(player)), 'block'
+        if not move:
+            move, source = self.book_move(), 'book'
+        if not move:
+            solved = self.table_move()
+            move, source = solved and solved[0], 'table'
+        if not move:
+            cached = self.cached_move()
+            if cached:
+                (move, score, depth), source = cached, 'cache'
+        if not move:
+            return None
+        self.record_search({'move': move, 'score': score, 'depth': depth, 'nodes': 0,
+                            'time': time.perf_counter() - started, 'pv': [move], 'source': source})
+        return move
+
+    def minimax_move(self):
+        move, score, depth = self.run_search(self.create_ai())
+        return move
+
+    def create_ai(self, cancel_event=None, on_iteration=None, context=None):
+        return CaroAI(
+            self.board,
+            self.win_condition,
+            time_limit_ms=self.settings['ai_time_limit_ms'],
+            context=context or self.get_search_context(),
+            candidate_radius=self.settings['ai_candidate_radius'],
+            cancel_event=cancel_event,
+            symmetry=self.settings['ai_symmetry'],
+            on_iteration=on_iteration,
+            exact=self.exact
+        )
+
+    def run_search(self, ai, cancel_event=None):
+        # Searches for the side to move at the time the CaroAI copy was made
+        search = self.search_position(ai, self.current_player, cancel_event)
+        self.record_search(search)
+        return search['move'], search['score'], search['depth']
+
+    def search_position(self, ai, player, cancel_event=None):
+        # The search behind run_search, returning its info dict without recording
+        # it, so a pondering search can be kept until its position comes up
+        workers = self.settings['ai_workers']
+        started = time.perf_counter()
+        forced, pv, root_moves, nodes = self.forced_move(ai, player, cancel_event)
+        iterations = []
+        if forced is not None:
+            move, score, depth = forced
+            source = 'forced'
+        else:
+            source = 'search'
+            # A failed exact solve or threat search used part of the budget
+            ai.time_limit_ms = max(1, self.settings['ai_time_limit_ms'] - (time.perf_counter() - started) * 1000)
+            if self.settings['ai_engine'] == 'mcts':
+                # Scores are win rates, not evaluations: kept out of the analysis cache
+                source = 'mcts'
+                mcts = self.get_mcts()
+                move, score, depth = mcts.search(ai.board, player, ai.time_limit_ms,
+                                                 self.settings['ai_mcts_iterations'], cancel_event, ai.on_iteration,
+                                                 root_moves)
+                nodes += mcts.rollouts
+                pv = mcts.principal_variation()
+            elif workers < 2 or root_moves:
+                move, score, depth = ai.search(player, root_moves)
+                nodes += ai.nodes
+                iterations = [dict(zip(('depth', 'move', 'score', 'nodes', 'time'), iteration))
+                              for iteration in ai.iterations]
+                pv = ai.principal_variation(player, move, depth)
+            else:
+                if self.parallel_search is None or self.parallel_search.workers != workers:
+                    if self.parallel_search is not None:
+                        self.parallel_search.shutdown()
+                    self.parallel_search = ParallelSearch(workers, self.settings['ai_tt_size_mb'])
+                move, score, depth = self.parallel_search.search(ai, player, cancel_event)
+                nodes += self.parallel_search.nodes
+                pv = self.parallel_search.pv
+        return {
+            'move': move,
+            'score': score,
+            'depth': depth,
+            'nodes': nodes,
+            'time': time.perf_counter() - started,
+            'pv': pv,
+            'source': source,
+            'iterations': iterations
+        }
+
+    def record_search(self, search):
+        # Every AI move ends up here: kept as last_search and appended to the log
+        search['nps'] = search['nodes'] / search['time'] if search['time'] else 0.0
+        self.last_search = search
+        if search['source'] in ('search', 'forced') and search['move'] is not None:
+            cache = self.get_analysis_cache()
+            if cache is not None:
+                cache.store(self.board, self.win_condition, self.settings['win_rule'], search['move'],
+                            search['score'], search['depth'], self.settings['ai_time_limit_ms'])
+        path = self.settings['ai_search_log']
+        if not path:
+            return
+        record = {
+            'timestamp': time.time(),
+            'size': self.size,
+            'win': self.win_condition,
+            'player': self.current_player,
+            'ply': len(self.move_history),
+            'difficulty': self.settings['ai_difficulty'],
+            'time_limit_ms': self.settings['ai_time_limit_ms']
+        }
+        record.update(search)
+        try:
+            with open(path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+        except OSError:
+            pass
+
+    def forced_move(self, ai, player, cancel_event=None):
+        # (result, pv, root_moves, nodes): result is (move, score, depth) when
+        # the position is solved, has a forced win or only one move stops the
+        # opponent's. Otherwise root_moves lists the moves that stop the
+        # opponent's forced win, or is None when it has none.
+        solved = self.solve_position(ai.board, player, cancel_event)
+        if solved is not None:
+            move, value, distance = solved
+            score = 0 if value == 0 else (ai.WIN_SCORE - distance) * (1 if value > 0 else -1)
+            return (move, score, distance), [move], None, 0
+        line, defences, nodes = self.threat_search(ai.board, player, cancel_event)
+        if line:
+            return (line[0], ai.WIN_SCORE - len(line), len(line)), line, None, nodes
+        if defences and len(defences) == 1:
+            return (defences[0], 0, 0), defences, None, nodes
+        return None, None, defences or None, nodes
+
+    def threat_search(self, board=None, player=None, cancel_event=None):
+        # (forced win for player, moves stopping the opponent's forced win, nodes)
+        budget = self.settings['ai_vcf_nodes']
+        if not budget:
+            return None, None, 0
+        board = board if board is not None else self.board
+        player = player or self.current_player
+        searcher = ThreatSearch(board, self.win_condition, budget, exact=self.exact, cancel_event=cancel_event)
+        line = searcher.vcf(player)
+        if line:
+            return line, None, searcher.nodes
+        nodes = searcher.nodes
+        searcher.failed = {}
+        searcher.nodes = 0
+        threat = searcher.vcf(other_player(player))
+        nodes += searcher.nodes
+        if threat is None:
+            return None, None, nodes
+        return None, searcher.defences(player, threat), nodes
+
+    def book_move(self):
+        # Instant reply from the opening book for this board configuration, if any.
+        # Books are built under the freestyle rule.
+        if not self.settings['ai_opening_book'] or self.exact:
+            return None
+        key = (self.size, self.win_condition)
+        if self.opening_book is None or self.opening_book_key != key:
+            from caro_book import OpeningBook, book_path
+            self.opening_book = OpeningBook(book_path(self.size, self.win_condition))
+            self.opening_book_key = key
+        entry = self.opening_book.lookup(self.board)
+        return entry[0] if entry else None
+
+    def table_move(self, board=None):
+        # Perfect-play entry ((row, col), value, distance) from the solved table, if any
+        from caro_solver import MAX_SIZE, SolvedTable, table_path
+        if not self.settings['ai_solver'] or self.size > MAX_SIZE or self.exact:
+            return None  # tables are built under the freestyle rule
+        key = (self.size, self.win_condition)
+        if self.solved_table is None or self.solved_table_key != key:
+            self.solved_table = SolvedTable(table_path(self.size, self.win_condition))
+            self.solved_table_key = key
+        return self.solved_table.lookup(board if board is not None else self.board)
+
+    def get_analysis_cache(self):
+        # The on-disk cache named in the settings, opened on first use
+        path = self.settings['ai_analysis_cache']
+        if not path:
+            return None
+        if self.analysis_cache is None or self.analysis_cache.path != path:
+            from caro_cache import AnalysisCache
+            if self.analysis_cache is not None:
+                self.analysis_cache.close()
+            self.analysis_cache = AnalysisCache(path)
+        self.analysis_cache.max_entries = self.settings['ai_analysis_cache_entries']
+        return self.analysis_cache
+
+    def cached_move(self, board=None):
+        # ((row, col), score, depth) from an earlier search of this position given
+        # at least the current time budget, possibly in another session
+        cache = self.get_analysis_cache()
+        if cache is None:
+            return None
+        return cache.lookup(board if board is not None else self.board, self.win_condition,
+                            self.settings['win_rule'], self.settings['ai_time_limit_ms'])
+
+    def solve_position(self, board=None, player=None, cancel_event=None):
+        # Exact result for the side to move: the solved table first, then a solve
+        # limited to half the time budget once few enough cells are left
+        from caro_solver import MAX_SIZE, Solver
+        board = board if board is not None else self.board
+        player = player or self.current_player
+        entry = self.table_move(board)
+        if entry is not None:
+            return entry
+        empty_cells = sum(row.count('') for row in board)
+        if (not self.settings['ai_solver'] or self.size > MAX_SIZE
+                or empty_cells > self.settings['ai_solver_empty_cells']):
+            return None
+        solver = Solver(board, self.win_condition, max(1, self.settings['ai_time_limit_ms'] // 2), cancel_event,
+                        self.exact)
+        return solver.solve(player)
+
+    def get_search_context(self):
+        # One context per board configuration, kept across moves and undos
+        key = (self.size, self.win_condition, self.exact, self.settings['ai_tt_size_mb'])
+        if self.search_context is None or self.search_context_key != key:
+            self.search_context = SearchContext(self.size, self.settings['ai_tt_size_mb'])
+            self.search_context_key = key
+        return self.search_context
+
+    def get_mcts(self):
+        # One Monte Carlo tree per board configuration, kept across moves and
+        # undos until a new game
+        from caro_mcts import MCTS
+        key = (self.size, self.win_condition, self.exact, self.settings['ai_mcts_batch'],
+               self.settings['ai_candidate_radius'])
+        if self.mcts is None or self.mcts_key != key:
+            self.mcts = MCTS(self.size, self.win_condition, self.exact, self.settings['ai_mcts_batch'],
+                             candidate_radius=self.settings['ai_candidate_radius'])
+            self.mcts_key = key
+        return self.mcts
+
+    # ===== PONDERING =====
+    def predicted_reply(self):
+        # The opponent's most likely answer to the AI's last move: the next move
+        # of that search's principal variation, else a win, a block or the
+        # best-ordered candidate
+        pv = (self.last_search or {}).get('pv') or []
+        if len(pv) >= 2 and self.move_history and tuple(pv[0]) == self.move_history[-1][:2]:
+            move = tuple(pv[1])
+            if self.is_legal(*move):
+                return move
+        player = self.current_player
+        move = self.find_winning_move(player) or self.find_winning_move(other_player(player))
+        if move:
+            return move
+        moves = self.create_ai().get_available_moves()
+        return moves[0] if moves else None
+
+    def create_ponder_ai(self, reply, cancel_event=None, on_iteration=None):
+        # Search copy of the position after the opponent plays reply, or None
+        # when that move ends the game and there is nothing to ponder
+        ai = self.create_ai(cancel_event, on_iteration)
+        ai.place(reply[0], reply[1], self.current_player)
+        if ai.bitboard.is_win(self.current_player) or ai.bitboard.is_full():
+            return None
+        return ai
+
+    def create_analysis_ai(self, cancel_event=None):
+        # Analysis compares every move at one depth, so it gets a table of its own:
+        # deeper entries left by earlier searches would score some moves a ply deeper
+        return self.create_ai(cancel_event, context=SearchContext(self.size, self.settings['ai_tt_size_mb']))
+
+    def shutdown(self, wait=False):
+        if self.parallel_search is not None:
+            self.parallel_search.shutdown(wait)
+            self.parallel_search = None
+        if self.opening_book is not None:
+            self.opening_book.close()
+        if self.solved_table is not None:
+            self.solved_table.close()
+        if self.analysis_cache is not None:
+            self.analysis_cache.close()
+
+    def __str__(self):
+        lines = ['   ' + ' '.join('%2d' % col for col in range(self.size))]
+        for row in range(self.size):
+            cells = ' '.join(' ' + (self.board[row][col] or '.') for col in range(self.size))
+            lines.append('%2d %s' % (row, cells))
+        return '\n'.join(lines)
+
+
+# ===== COMMAND LINE =====
+def parse_moves(text):
+    # "7,7 7,8 8,8" -> [(7, 7), (7, 8), (8, 8)], rows and columns from 0
+    moves = []
+    for token in text.replace(';', ' ').split():
+        row, col = token.split(',')
+        moves.append((int(row), int(col)))
+    return moves
+
+
+def game_from_args(args):
+    settings = load_settings(args.settings)
+    overrides = {
+        'board_size': args.size,
+        'win_condition': args.win,
+        'win_rule': args.rule,
+        'ai_difficulty': args.difficulty,
+        'ai_time_limit_ms': args.time_ms,
+        'ai_workers': args.workers,
+        'ai_search_log': args.log,
+        'ai_analysis_cache': args.cache,
+        'ai_engine': args.engine
+    }
+    settings.update({key: value for key, value in overrides.items() if value is not None})
+    game = CaroGame(settings)
+    for row, col in parse_moves(args.moves or ''):
+        if not game.is_legal(row, col):
+            raise SystemExit('illegal move: %d,%d' % (row, col))
+        game.play(row, col)
+    return game
+
+
+def format_search(info):
+    # One "thinking" line: depth, score, nodes, time, speed and expected line
+    return 'depth %2d  score %11d  nodes %8d  %6.2f s  %7.0f n/s  pv %s' % (
+        info['depth'], info['score'], info['nodes'], info['time'], info.get('nps', 0.0),
+        ' '.join('%d,%d' % move for move in info['pv']) or '-')
+
+
+def command_best(args):
+    game = game_from_args(args)
+    try:
+        if game.winner:
+            print('game over: %s wins' % game.winner)
+            return 1
+        started = time.perf_counter()
+        move = game.best_move()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if move is None:
+            print('no legal move')
+            return 1
+        print('%d %d' % move)
+        print('# %s to move, %s AI, %.0f ms' % (game.current_player, game.settings['ai_difficulty'], elapsed_ms),
+              file=sys.stderr)
+        if game.last_search is not None:
+            print('# %s (%s)' % (format_search(game.last_search), game.last_search['source']), file=sys.stderr)
+        return 0
+    finally:
+        game.shutdown(wait=True)
+
+
+def command_analyse(args):
+    game = game_from_args(args)
+    try:
+        print(game)
+        if game.winner:
+            print('winner: %s %s' % (game.winner, game.winning_cells()))
+            return 0
+        # Live readout: one line per finished iteration while the search runs
+        ai = game.create_ai(on_iteration=lambda info: print(format_search(info), flush=True))
+        counts = ai.evaluator.pattern_counts
+        print('to move: %s' % game.current_player)
+        print('eval (O positive): %d' % ai.evaluate_board())
+        for player in ('X', 'O'):
+            patterns = ', '.join('%d:%d' % (k, counts[player][k]) for k in range(1, game.win_condition)
+                                 if counts[player][k])
+            print('live windows %s (stones:count): %s' % (player, patterns or '-'))
+        line, defences, _ = game.threat_search()
+        if line:
+            print('forced win (VCF): %s' % ' '.join('%d,%d' % move for move in line))
+        elif defences is not None:
+            print('opponent has a forced win, defences: %s'
+                  % (' '.join('%d,%d' % move for move in defences) or 'none'))
+        move, score, depth = game.run_search(ai)
+        print('best: %s (%s)' % (move, game.last_search['source']))
+        print(format_search(game.last_search))
+        if args.top:
+            # Every candidate scored, as in the GUI's analysis mode
+            result = game.create_analysis_ai().analyse(game.current_player)
+            if result:
+                print('top moves at depth %d:' % result['depth'])
+                for (row, col), score, pv in result['lines'][:args.top]:
+                    print('  %d,%d  score %11d  pv %s' % (row, col, score, ' '.join('%d,%d' % m for m in pv)))
+        return 0
+    finally:
+        game.shutdown(wait=True)
+
+
+def command_play(args):
+    game = game_from_args(args)
+    try:
+        human = 'X' if not args.ai_first else 'O'
+        result = None
+        while result is None and game.winner is None:
+            print(game)
+            if game.current_player == human:
+                try:
+                    text = input('%s move (row,col): ' % human)
+                except EOFError:
+                    return 0
+                try:
+                    (row, col), = parse_moves(text)
+                except ValueError:
+                    print('enter a move as row,col')
+                    continue
+                if not game.is_legal(row, col):
+                    print('illegal move')
+                    continue
+            else:
+                game.last_search = None
+                row, col = game.best_move()
+                print('AI plays %d,%d' % (row, col))
+                if game.last_search is not None:
+                    print(format_search(game.last_search))
+            result = game.play(row, col)
+        print(game)
+        print('%s wins' % game.winner if result == 'win' else 'draw')
+        return 0
+    finally:
+        game.shutdown(wait=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Headless Caro engine')
+    commands = parser.add_subparsers(dest='command', required=True)
+    handlers = {'best': command_best, 'analyse': command_analyse, 'play': command_play}
+    helps = {
+        'best': 'print the best move for the side to move',
+        'analyse': 'print the board, evaluation, threat counts and search result',
+        'play': 'play against the AI in the terminal'
+    }
+    for name in handlers:
+        sub = commands.add_parser(name, help=helps[name])
+        sub.add_argument('--settings', default='caro_settings.json', help='settings file to start from')
+        sub.add_argument('--size', type=int, help='board size')
+        sub.add_argument('--win', type=int, help='stones in a row needed to win')
+        sub.add_argument('--rule', choices=['freestyle', 'exact'], help='exact: an overline does not win')
+        sub.add_argument('--difficulty', choices=['easy', 'medium', 'hard'])
+        sub.add_argument('--time-ms', type=int, help='hard AI time budget per move')
+        sub.add_argument('--engine', choices=['alphabeta', 'mcts'], help='hard AI search (mcts: Monte Carlo tree search)')
+        sub.add_argument('--workers', type=int, help='processes for the hard AI search')
+        sub.add_argument('--moves', help='moves played so far, X first, e.g. "7,7 7,8"')
+        sub.add_argument('--log', help='append one JSON line per AI move to this file')
+        sub.add_argument('--cache', help='SQLite analysis cache shared between sessions')
+        if name == 'play':
+            sub.add_argument('--ai-first', action='store_true', help='let the AI play X')
+        if name == 'analyse':
+            sub.add_argument('--top', type=int, help='also score every candidate and list the best N')
+    args = parser.parse_args(argv)
+    if args.command != 'play' and args.difficulty is None:
+        args.difficulty = 'hard'
+    return handlers[args.command](args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,10 +2,16 @@ import tkinter as tk
 from tkinter import messagebox, ttk
 import json
 import os
-import random
-import math
+import threading
+import queue
+
+from caro_engine import CaroAI, CaroGame
+from caro_record import FLAG_AI_O, append_game
 
 class AdvancedCaroGame:
+    AI_POLL_MS = 30  # how often the UI checks for a finished background search
+    BOARD_PIXELS = 400  # board canvas side length before rounding to whole cells
+
     def __init__(self):
         self.root = tk.Tk()
         self.root.title("Game Cờ Caro - Advanced")
@@ -18,7 +24,10 @@ class AdvancedCaroGame:
             'win_condition': 5,
             'game_mode': 'human',  # 'human' or 'ai'
             'ai_difficulty': 'medium',  # 'easy', 'medium', 'hard'
-            'theme': 'default'  # 'default', 'dark'
+            'theme': 'default',  # 'default', 'dark'
+            'game_archive': 'caro_games.bin',  # finished games are appended here, None = off
+            'ai_analysis_cache': 'caro_analysis.db',  # searched positions remembered between sessions
+            'analysis_top_moves': 3  # moves listed under the board in analysis mode
         }
         
         # Game state
@@ -30,10 +39,19 @@ class AdvancedCaroGame:
             'move_history': [],
             'is_ai_turn': False
         }
+        self.ai_search = None
+        self.ai_after_id = None
+        self.ponder = None
+        self.analysis = None
+        self.analysis_on = False
+        self.heatmap_cells = set()  # cells the analysis has painted over
         
         # Load settings
         self.load_settings()
         
+        # Headless engine holding the board, rules and AI; shares self.settings
+        self.engine = CaroGame(self.settings)
+        
         # Setup colors and fonts
         self.setup_style()
         
@@ -85,6 +103,7 @@ class AdvancedCaroGame:
             widget.destroy()
     
     def show_menu(self):
+        self.cancel_ai_search()
         self.clear_screen()
         self.current_screen = 'menu'
         
@@ -127,6 +146,7 @@ class AdvancedCaroGame:
             btn.pack(pady=10)
     
     def show_settings(self):
+        self.cancel_ai_search()
         self.clear_screen()
         self.current_screen = 'settings'
         
@@ -147,7 +167,7 @@ class AdvancedCaroGame:
         # Board size
         tk.Label(settings_frame, text="Kích thước bàn cờ:", font=self.fonts['heading'], bg=self.colors['bg'], fg=self.colors['fg']).pack(anchor='w', pady=(0, 5))
         self.board_size_var = tk.StringVar(value=str(self.settings['board_size']))
-        board_size_combo = ttk.Combobox(settings_frame, textvariable=self.board_size_var, values=['3', '4', '5', '6', '7', '8', '9', '10'], state='readonly', font=self.fonts['text'])
+        board_size_combo = ttk.Combobox(settings_frame, textvariable=self.board_size_var, values=[str(i) for i in range(3, 20)], state='readonly', font=self.fonts['text'])
         board_size_combo.pack(fill='x', pady=(0, 15))
         board_size_combo.bind('<<ComboboxSelected>>', self.on_board_size_change)
         
@@ -158,12 +178,24 @@ class AdvancedCaroGame:
         self.win_condition_combo.pack(fill='x', pady=(0, 15))
         self.update_win_condition_options()
         
+        # Win rule: 'exact' means an overline (more than win_condition in a row) does not win
+        tk.Label(settings_frame, text="Luật thắng (freestyle: từ N quân trở lên, exact: đúng N quân):", font=self.fonts['heading'], bg=self.colors['bg'], fg=self.colors['fg']).pack(anchor='w', pady=(0, 5))
+        self.win_rule_var = tk.StringVar(value=self.settings.get('win_rule', 'freestyle'))
+        win_rule_combo = ttk.Combobox(settings_frame, textvariable=self.win_rule_var, values=['freestyle', 'exact'], state='readonly', font=self.fonts['text'])
+        win_rule_combo.pack(fill='x', pady=(0, 15))
+        
         # AI difficulty
         tk.Label(settings_frame, text="Độ khó AI:", font=self.fonts['heading'], bg=self.colors['bg'], fg=self.colors['fg']).pack(anchor='w', pady=(0, 5))
         self.ai_difficulty_var = tk.StringVar(value=self.settings['ai_difficulty'])
         ai_combo = ttk.Combobox(settings_frame, textvariable=self.ai_difficulty_var, values=['easy', 'medium', 'hard'], state='readonly', font=self.fonts['text'])
         ai_combo.pack(fill='x', pady=(0, 15))
         
+        # Search used by the hard AI: alpha-beta, or Monte Carlo tree search for large boards
+        tk.Label(settings_frame, text="Thuật toán AI Khó (mcts: tìm kiếm Monte Carlo, hợp bàn lớn):", font=self.fonts['heading'], bg=self.colors['bg'], fg=self.colors['fg']).pack(anchor='w', pady=(0, 5))
+        self.ai_engine_var = tk.StringVar(value=self.settings['ai_engine'])
+        engine_combo = ttk.Combobox(settings_frame, textvariable=self.ai_engine_var, values=['alphabeta', 'mcts'], state='readonly', font=self.fonts['text'])
+        engine_combo.pack(fill='x', pady=(0, 15))
+        
         # Theme
         tk.Label(settings_frame, text="Giao diện:", font=self.fonts['heading'], bg=self.colors['bg'], fg=self.colors['fg']).pack(anchor='w', pady=(0, 5))
         self.theme_var = tk.StringVar(value=self.settings['theme'])
@@ -193,7 +225,9 @@ class AdvancedCaroGame:
     def save_settings(self):
         self.settings['board_size'] = int(self.board_size_var.get())
         self.settings['win_condition'] = int(self.win_condition_var.get())
+        self.settings['win_rule'] = self.win_rule_var.get()
         self.settings['ai_difficulty'] = self.ai_difficulty_var.get()
+        self.settings['ai_engine'] = self.ai_engine_var.get()
         old_theme = self.settings['theme']
         self.settings['theme'] = self.theme_var.get()
         
@@ -216,15 +250,18 @@ class AdvancedCaroGame:
 • AI sẽ tự động đi sau bạn
 
 ⚙️ CÀI ĐẶT:
-• Kích thước bàn: 3x3 đến 10x10
+• Kích thước bàn: 3x3 đến 19x19
 • Số quân thắng: 3-6 quân
+• Luật thắng: freestyle (từ N quân trở lên) hoặc exact (đúng N quân, hàng dài hơn không tính)
 • Độ khó AI: Dễ, Trung bình, Khó
+• Thuật toán AI Khó: alphabeta hoặc mcts (hợp bàn lớn)
 
 ⌨️ PHÍM TẮT:
 • R: Chơi lại
 • N: Game mới
 • H: Gợi ý (chỉ với AI)
 • U: Hoàn tác
+• A: Bật/tắt chế độ phân tích (tô màu điểm từng ô)
 • Q: Thoát
 
 🤖 ĐỘ KHÓ AI:
@@ -241,11 +278,13 @@ class AdvancedCaroGame:
         self.show_game_screen()
     
     def initialize_game(self):
-        size = self.settings['board_size']
-        self.game_state['board'] = [['' for _ in range(size)] for _ in range(size)]
-        self.game_state['current_player'] = 'X'
+        self.cancel_ai_search()
+        self.engine.new_game()
+        # The board and history lists are the engine's own, never copies
+        self.game_state['board'] = self.engine.board
+        self.game_state['current_player'] = self.engine.current_player
         self.game_state['game_active'] = True
-        self.game_state['move_history'] = []
+        self.game_state['move_history'] = self.engine.move_history
         self.game_state['is_ai_turn'] = False
     
     def show_game_screen(self):
@@ -301,6 +340,8 @@ class AdvancedCaroGame:
         # Game status
         self.status_label = tk.Label(self.root, text="", font=self.fonts['heading'], bg=self.colors['bg'], fg=self.colors['success'])
         self.status_label.pack(pady=10)
+        self.analysis_label = tk.Label(self.root, text="", font=self.fonts['text'], bg=self.colors['bg'], fg=self.colors['fg'], justify='left')
+        self.analysis_label.pack()
         
         # Control buttons
         control_frame = tk.Frame(self.root, bg=self.colors['bg'])
@@ -319,39 +360,76 @@ class AdvancedCaroGame:
         undo_btn = tk.Button(control_frame, text="↶ Hoàn tác", font=self.fonts['button'], bg=self.colors['secondary'], fg='white', command=self.undo_move)
         undo_btn.pack(side='left', padx=5)
         
+        analysis_btn = tk.Button(control_frame, text="📊 Phân tích", font=self.fonts['button'], bg=self.colors['primary'], fg='white', command=self.toggle_analysis)
+        analysis_btn.pack(side='left', padx=5)
+        
         # Keyboard bindings
         self.root.bind('<Key>', self.on_key_press)
         self.root.focus_set()
+        self.update_analysis()
     
     def create_game_board(self):
-        board_frame = tk.Frame(self.root, bg=self.colors['bg'])
-        board_frame.pack(pady=20)
-        
+        # One canvas for the whole board: the grid is drawn once and each cell
+        # keeps a background rectangle and a text item that draw_cell updates
         size = self.settings['board_size']
-        self.board_buttons = []
+        self.cell_size = max(12, min(60, self.BOARD_PIXELS // size))
+        pixels = self.cell_size * size
         
-        # Calculate button size based on board size
-        button_size = max(2, 8 - size // 2)
-        font_size = max(12, 24 - size * 2)
+        self.board_canvas = tk.Canvas(
+            self.root,
+            width=pixels + 1,
+            height=pixels + 1,
+            bg=self.colors['button_bg'],
+            highlightthickness=0,
+            bd=0,
+            cursor='hand2'
+        )
+        self.board_canvas.pack(pady=20)
+        self.board_enabled = True
         
+        font = ('Arial', max(8, self.cell_size * 11 // 20), 'bold')
+        self.cell_items = []
+        self.heatmap_cells = set()
         for i in range(size):
             row = []
             for j in range(size):
-                btn = tk.Button(
-                    board_frame,
-                    text='',
-                    font=('Arial', font_size, 'bold'),
-                    width=button_size,
-                    height=button_size//2,
-                    command=lambda r=i, c=j: self.make_move(r, c),
-                    bg=self.colors['button_bg'],
-                    relief='raised',
-                    bd=2,
-                    cursor='hand2'
+                x, y = j * self.cell_size, i * self.cell_size
+                rect = self.board_canvas.create_rectangle(
+                    x, y, x + self.cell_size, y + self.cell_size,
+                    fill=self.colors['button_bg'], outline=''
+                )
+                text = self.board_canvas.create_text(
+                    x + self.cell_size // 2, y + self.cell_size // 2, text='', font=font
                 )
-                btn.grid(row=i, column=j, padx=1, pady=1)
-                row.append(btn)
-            self.board_buttons.append(row)
+                row.append((rect, text))
+            self.cell_items.append(row)
+        
+        for k in range(size + 1):
+            offset = k * self.cell_size
+            self.board_canvas.create_line(0, offset, pixels, offset, fill=self.colors['secondary'])
+            self.board_canvas.create_line(offset, 0, offset, pixels, fill=self.colors['secondary'])
+        
+        self.board_canvas.bind('<Button-1>', self.on_board_click)
+    
+    def on_board_click(self, event):
+        if not self.board_enabled:
+            return
+        row, col = int(event.y // self.cell_size), int(event.x // self.cell_size)
+        size = self.settings['board_size']
+        if 0 <= row < size and 0 <= col < size:
+            self.make_move(row, col)
+    
+    def draw_cell(self, row, col, bg=None):
+        player = self.game_state['board'][row][col]
+        if player == 'X':
+            fg, default_bg = self.colors['danger'], '#ffe6e6'
+        elif player == 'O':
+            fg, default_bg = self.colors['primary'], '#e6f3ff'
+        else:
+            fg, default_bg = 'black', self.colors['button_bg']
+        rect, text = self.cell_items[row][col]
+        self.board_canvas.itemconfig(rect, fill=bg or default_bg)
+        self.board_canvas.itemconfig(text, text=player, fill=fg)
     
     def make_move(self, row, col):
         if (not self.game_state['game_active'] or 
@@ -361,23 +439,20 @@ class AdvancedCaroGame:
         
         # Make move
         player = self.game_state['current_player']
-        self.game_state['board'][row][col] = player
-        self.game_state['move_history'].append((row, col, player))
+        result = self.engine.play(row, col)
+        if result or (self.ponder is not None and self.ponder['reply'] != (row, col)):
+            self.cancel_ponder()
         
         # Update UI
-        btn = self.board_buttons[row][col]
-        btn.config(text=player, state='disabled')
-        if player == 'X':
-            btn.config(fg=self.colors['danger'], bg='#ffe6e6')
-        else:
-            btn.config(fg=self.colors['primary'], bg='#e6f3ff')
+        self.draw_cell(row, col)
         
         # Check win/draw
-        if self.check_winner(row, col, player):
+        if result == 'win':
+            self.highlight_winning_cells(self.engine.winning_cells())
             self.handle_game_end('win', player)
             return
         
-        if self.check_draw():
+        if result == 'draw':
             self.handle_game_end('draw')
             return
         
@@ -387,9 +462,13 @@ class AdvancedCaroGame:
         # AI move
         if self.settings['game_mode'] == 'ai' and self.game_state['current_player'] == 'O':
             self.game_state['is_ai_turn'] = True
-            self.root.after(500, self.make_ai_move)
+            # A reply the AI pondered on is answered without the usual pause
+            delay = 0 if self.ponder is not None else 500
+            self.ai_after_id = self.root.after(delay, self.make_ai_move)
+        self.update_analysis()
     
     def make_ai_move(self):
+        self.ai_after_id = None
         if not self.game_state['game_active']:
             return
         
@@ -397,135 +476,211 @@ class AdvancedCaroGame:
         difficulty = self.settings['ai_difficulty']
         
         if difficulty == 'easy':
-            move = self.get_random_move()
+            move = self.engine.get_random_move()
         elif difficulty == 'medium':
-            move = self.get_medium_ai_move()
-        else:  # hard
-            move = self.get_hard_ai_move()
+            move = self.engine.get_medium_ai_move()
+        else:  # hard: quick checks here, the search itself runs in the background
+            move = self.engine.quick_move()
+            if not move:
+                self.start_ai_search()
+                return
         
+        self.play_ai_move(move)
+    
+    def play_ai_move(self, move):
         if move:
             self.game_state['is_ai_turn'] = False
             self.make_move(move[0], move[1])
-    
-    # ===== AI ALGORITHMS =====
-    def get_random_move(self):
-        moves = self.get_available_moves()
-        return random.choice(moves) if moves else None
-    
-    def get_medium_ai_move(self):
-        # Check for winning move
-        move = self.find_winning_move('O')
-        if move:
-            return move
-        
-        # Block player winning move
-        move = self.find_winning_move('X')
-        if move:
-            return move
-        
-        # Take center if available
-        size = self.settings['board_size']
-        center = size // 2
-        if self.game_state['board'][center][center] == '':
-            return (center, center)
-        
-        # Random move
-        return self.get_random_move()
-    
-    def get_hard_ai_move(self):
-        # Simple minimax for smaller boards
-        if self.settings['board_size'] <= 5:
-            return self.minimax_move()
-        else:
-            return self.get_medium_ai_move()
-    
-    def minimax_move(self):
-        best_score = -float('inf')
-        best_move = None
-        
-        for row, col in self.get_available_moves():
-            self.game_state['board'][row][col] = 'O'
-            score = self.minimax(False, 3)
-            self.game_state['board'][row][col] = ''
-            
-            if score > best_score:
-                best_score = score
-                best_move = (row, col)
-        
-        return best_move
-    
-    def minimax(self, is_maximizing, depth):
-        if depth == 0:
-            return self.evaluate_board()
-        
-        moves = self.get_available_moves()
-        if not moves:
-            return 0
-        
-        if is_maximizing:
-            max_score = -float('inf')
-            for row, col in moves:
-                self.game_state['board'][row][col] = 'O'
-                score = self.minimax(False, depth - 1)
-                self.game_state['board'][row][col] = ''
-                max_score = max(score, max_score)
-            return max_score
+            self.start_ponder()
+    
+    # ===== BACKGROUND SEARCH =====
+    def start_ai_search(self):
+        # Tk is not thread-safe: the worker only fills a queue that the UI polls
+        ponder, self.ponder = self.ponder, None
+        self.cancel_ai_search()
+        if ponder is not None and ponder['reply'] == self.engine.move_history[-1][:2]:
+            # The human played the predicted reply: that search is running or done
+            search = ponder
         else:
-            min_score = float('inf')
-            for row, col in moves:
-                self.game_state['board'][row][col] = 'X'
-                score = self.minimax(True, depth - 1)
-                self.game_state['board'][row][col] = ''
-                min_score = min(score, min_score)
-            return min_score
-    
-    def evaluate_board(self):
-        # Simple evaluation function
-        score = 0
-        size = self.settings['board_size']
-        
-        # Check all directions
-        directions = [(0, 1), (1, 0), (1, 1), (1, -1)]
-        
-        for row in range(size):
-            for col in range(size):
-                for dr, dc in directions:
-                    score += self.evaluate_line(row, col, dr, dc, 'O') * 10
-                    score -= self.evaluate_line(row, col, dr, dc, 'X') * 10
-        
-        return score
-    
-    def evaluate_line(self, row, col, dr, dc, player):
-        count = 0
-        size = self.settings['board_size']
-        win_condition = self.settings['win_condition']
-        
-        for i in range(win_condition):
-            r, c = row + i * dr, col + i * dc
-            if 0 <= r < size and 0 <= c < size and self.game_state['board'][r][c] == player:
-                count += 1
-            else:
+            if ponder is not None:
+                self.stop_search(ponder)
+            search = self.start_search_thread(self.engine.create_ai(), 'O')
+        self.ai_search = search
+        self.status_label.config(text="🤖 Máy đang suy nghĩ...")
+        self.poll_ai_search(search)
+    
+    def start_search_thread(self, ai, player):
+        cancel_event = threading.Event()
+        results = queue.Queue()
+        search = {'cancel': cancel_event, 'results': results}
+        ai.cancel_event = cancel_event
+        # Every finished depth is passed on for the live "thinking" readout
+        ai.on_iteration = lambda info: results.put(('progress', info))
+        
+        def worker():
+            results.put(('move', self.engine.search_position(ai, player, cancel_event)))
+        
+        search['thread'] = threading.Thread(target=worker, daemon=True)
+        search['thread'].start()
+        return search
+    
+    def stop_search(self, search):
+        # Cancels a background search and waits for its thread: the next search
+        # shares the game's table, history and killers, which are not thread-safe.
+        # Every stage checks the cancel flag, so the wait is a few milliseconds.
+        search['cancel'].set()
+        search['thread'].join()
+    
+    def start_ponder(self):
+        # Search on the human's time, on the position after their expected reply
+        self.cancel_ponder()
+        if (not self.settings['ai_ponder'] or self.settings['ai_difficulty'] != 'hard' or self.analysis_on
+                or not self.game_state['game_active'] or self.game_state['current_player'] != 'X'):
+            return
+        reply = self.engine.predicted_reply()
+        ai = reply and self.engine.create_ponder_ai(reply)
+        if ai:
+            self.ponder = self.start_search_thread(ai, 'O')
+            self.ponder['reply'] = reply
+    
+    def cancel_ponder(self):
+        if self.ponder is not None:
+            self.stop_search(self.ponder)
+            self.ponder = None
+    
+    def poll_ai_search(self, search):
+        if search is not self.ai_search:
+            return
+        while True:
+            try:
+                kind, value = search['results'].get_nowait()
+            except queue.Empty:
+                self.root.after(self.AI_POLL_MS, self.poll_ai_search, search)
+                return
+            if kind == 'move':
+                self.engine.record_search(value)
+                move = value['move']
                 break
-        
-        return count
-    
-    def find_winning_move(self, player):
-        for row, col in self.get_available_moves():
-            self.game_state['board'][row][col] = player
-            if self.check_winner(row, col, player):
-                self.game_state['board'][row][col] = ''
-                return (row, col)
-            self.game_state['board'][row][col] = ''
-        return None
+            self.status_label.config(text=f"🤖 Máy đang suy nghĩ... độ sâu {value['depth']}, "
+                                          f"{value['nodes']:,} nút, {value['time']:.1f} giây")
+        
+        self.ai_search = None
+        self.status_label.config(text="")
+        self.play_ai_move(move)
+    
+    def cancel_ai_search(self):
+        # Called by undo, reset, menu and quit so a stale search never plays
+        self.cancel_ponder()
+        self.stop_analysis()
+        if self.ai_after_id is not None:
+            self.root.after_cancel(self.ai_after_id)
+            self.ai_after_id = None
+        if self.ai_search is not None:
+            self.stop_search(self.ai_search)
+            self.ai_search = None
+            self.status_label.config(text="")
+    
+    # ===== ANALYSIS MODE =====
+    def toggle_analysis(self):
+        self.analysis_on = not self.analysis_on
+        self.update_analysis()
+    
+    def update_analysis(self):
+        # Restarts the analysis on the current position, or just clears the
+        # heatmap while it is off, the game is over or the AI is thinking
+        self.stop_analysis()
+        self.clear_heatmap()
+        if not self.analysis_on or not self.game_state['game_active'] or self.game_state['is_ai_turn']:
+            return
+        cancel_event = threading.Event()
+        ai = self.engine.create_analysis_ai(cancel_event=cancel_event)
+        ai.time_limit_ms = self.settings['ai_analysis_time_ms']
+        results = queue.Queue()
+        analysis = {'cancel': cancel_event, 'results': results, 'player': self.engine.current_player}
+        
+        def worker():
+            ai.analyse(analysis['player'], on_update=results.put)
+            results.put(None)
+        
+        self.analysis = analysis
+        threading.Thread(target=worker, daemon=True).start()
+        self.analysis_label.config(text="📊 Đang phân tích...")
+        self.root.after(self.AI_POLL_MS, self.poll_analysis, analysis)
+    
+    def poll_analysis(self, analysis):
+        if analysis is not self.analysis:
+            return
+        # Only the newest update is painted, however many arrived since the last poll
+        info, finished = None, False
+        while True:
+            try:
+                item = analysis['results'].get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                finished = True
+            else:
+                info = item
+        if info is not None:
+            self.paint_analysis(info)
+        if not finished:
+            self.root.after(self.AI_POLL_MS, self.poll_analysis, analysis)
+    
+    def stop_analysis(self):
+        if self.analysis is not None:
+            self.analysis['cancel'].set()
+            self.analysis = None
+    
+    def clear_heatmap(self):
+        # Only repaints what the analysis painted, so with analysis off a move
+        # still redraws just its own cell
+        for row, col in self.heatmap_cells:
+            if self.game_state['board'][row][col] == '':
+                self.draw_cell(row, col)
+        self.heatmap_cells = set()
+        self.analysis_label.config(text="")
+    
+    def paint_analysis(self, info):
+        # Cells coloured from red (worst) to green (best) for the side to move,
+        # the top moves numbered on the board and listed with their lines
+        decisive = CaroAI.WIN_SCORE - 1000
+        values = [score for score in info['scores'].values() if abs(score) < decisive] or [0]
+        low, high = min(values), max(values)
+        for (row, col), score in info['scores'].items():
+            if self.game_state['board'][row][col] == '':
+                self.draw_cell(row, col, bg=self.heat_color(score, low, high))
+                self.heatmap_cells.add((row, col))
+        
+        lines = [f"📊 Phân tích độ sâu {info['depth']}{'' if info['complete'] else '...'}, {info['nodes']:,} nút"]
+        for rank, ((row, col), score, pv) in enumerate(info['lines'][:self.settings['analysis_top_moves']], 1):
+            if self.game_state['board'][row][col] == '':
+                self.board_canvas.itemconfig(self.cell_items[row][col][1], text=str(rank), fill='black')
+            line = ' '.join(f"{r+1},{c+1}" for r, c in pv[:6])
+            lines.append(f"{rank}. Hàng {row+1}, Cột {col+1}: {self.score_text(score)}   ({line})")
+        self.analysis_label.config(text='\n'.join(lines))
+    
+    def heat_color(self, score, low, high):
+        decisive = CaroAI.WIN_SCORE - 1000
+        if score >= decisive:
+            t = 1.0
+        elif score <= -decisive:
+            t = 0.0
+        else:
+            t = (score - low) / (high - low) if high > low else 1.0
+        # red -> yellow -> green
+        if t < 0.5:
+            start, end, t = (231, 76, 60), (241, 196, 15), t * 2
+        else:
+            start, end, t = (241, 196, 15), (46, 204, 113), t * 2 - 1
+        return '#%02x%02x%02x' % tuple(int(a + (b - a) * t) for a, b in zip(start, end))
     
-    def get_available_moves(self):
-        moves = []
-        size = self.settings['board_size']
-        for row in range(size):
-            for col in range(size):
-                if self.game_state['board'][row][col] == '':
-                    moves.append((row, col))
-        return moves
+    def score_text(self, score):
+        decisive = CaroAI.WIN_SCORE - 1000
+        if score >= decisive:
+            return "thắng"
+        if score <= -decisive:
+            return "thua"
+        return f"{score:+d}"
     
     # ===== GAME HELPERS =====
     def show_hint(self):
@@ -533,84 +688,52 @@ class AdvancedCaroGame:
             messagebox.showwarning("Gợi ý", "Gợi ý chỉ khả dụng khi chơi với máy và đến lượt bạn!")
             return
         
-        move = self.get_medium_ai_move()
+        # Small boards get the exact answer when it is quick to find, positions
+        # searched before (in any session) the remembered best move
+        solved = self.engine.solve_position()
+        cached = None if solved else self.engine.cached_move()
+        move = solved[0] if solved else cached[0] if cached else self.engine.get_medium_ai_move()
         if move:
-            btn = self.board_buttons[move[0]][move[1]]
-            original_bg = btn.cget('bg')
-            btn.config(bg='yellow')
-            self.root.after(2000, lambda: btn.config(bg=original_bg))
-            messagebox.showinfo("Gợi ý", f"Đề xuất: Hàng {move[0]+1}, Cột {move[1]+1}")
+            self.draw_cell(move[0], move[1], bg='yellow')
+            self.root.after(2000, lambda: self.draw_cell(move[0], move[1]))
+            text = f"Đề xuất: Hàng {move[0]+1}, Cột {move[1]+1}"
+            if solved:
+                outcome = "thắng" if solved[1] > 0 else "thua" if solved[1] < 0 else "hòa"
+                text += f"\n(Chơi hoàn hảo: {outcome} sau {solved[2]} nước)"
+            elif cached:
+                text += f"\n(Đã phân tích trước đó, độ sâu {cached[2]})"
+            messagebox.showinfo("Gợi ý", text)
     
     def undo_move(self):
+        self.cancel_ai_search()
         if not self.game_state['move_history']:
             messagebox.showwarning("Hoàn tác", "Không có nước đi nào để hoàn tác!")
             return
         
         # Undo moves (1 for human vs human, 2 for human vs AI)
         moves_to_undo = 2 if self.settings['game_mode'] == 'ai' else 1
+        if self.game_state['is_ai_turn']:
+            # The cancelled AI reply was never played, only take back the human move
+            moves_to_undo = 1
         moves_to_undo = min(moves_to_undo, len(self.game_state['move_history']))
         
         for _ in range(moves_to_undo):
             if self.game_state['move_history']:
-                row, col, player = self.game_state['move_history'].pop()
-                self.game_state['board'][row][col] = ''
-                btn = self.board_buttons[row][col]
-                btn.config(text='', state='normal', bg=self.colors['button_bg'], fg='black')
+                row, col, player = self.engine.undo()
+                self.draw_cell(row, col)
         
         # Reset current player
-        self.game_state['current_player'] = 'X' if len(self.game_state['move_history']) % 2 == 0 else 'O'
+        self.game_state['current_player'] = self.engine.current_player
         self.game_state['is_ai_turn'] = False
         self.update_current_player_display()
-    
-    def check_winner(self, row, col, player):
-        size = self.settings['board_size']
-        win_condition = self.settings['win_condition']
-        directions = [(0, 1), (1, 0), (1, 1), (1, -1)]
-        
-        for dr, dc in directions:
-            count = 1
-            winning_cells = [(row, col)]
-            
-            # Check positive direction
-            for i in range(1, win_condition):
-                new_row, new_col = row + i * dr, col + i * dc
-                if (0 <= new_row < size and 0 <= new_col < size and 
-                    self.game_state['board'][new_row][new_col] == player):
-                    count += 1
-                    winning_cells.append((new_row, new_col))
-                else:
-                    break
-            
-            # Check negative direction
-            for i in range(1, win_condition):
-                new_row, new_col = row - i * dr, col - i * dc
-                if (0 <= new_row < size and 0 <= new_col < size and 
-                    self.game_state['board'][new_row][new_col] == player):
-                    count += 1
-                    winning_cells.append((new_row, new_col))
-                else:
-                    break
-            
-            if count >= win_condition:
-                self.highlight_winning_cells(winning_cells)
-                return True
-        
-        return False
+        self.update_analysis()
     
     def highlight_winning_cells(self, cells):
         for row, col in cells:
-            self.board_buttons[row][col].config(bg='lightgreen')
-    
-    def check_draw(self):
-        size = self.settings['board_size']
-        for row in range(size):
-            for col in range(size):
-                if self.game_state['board'][row][col] == '':
-                    return False
-        return True
+            self.draw_cell(row, col, bg='lightgreen')
     
     def switch_player(self):
-        self.game_state['current_player'] = 'O' if self.game_state['current_player'] == 'X' else 'X'
+        self.game_state['current_player'] = self.engine.current_player
         self.update_current_player_display()
     
     def update_current_player_display(self):
@@ -623,6 +746,7 @@ class AdvancedCaroGame:
     
     def handle_game_end(self, result, winner=None):
         self.game_state['game_active'] = False
+        self.update_analysis()
         
         if result == 'win':
             self.game_state['score'][winner] += 1
@@ -647,13 +771,21 @@ class AdvancedCaroGame:
             self.status_label.config(text=title)
             messagebox.showinfo("Kết quả", message)
         
-        self.disable_all_buttons()
+        self.disable_board()
+        self.archive_game()
     
-    def disable_all_buttons(self):
-        size = self.settings['board_size']
-        for row in range(size):
-            for col in range(size):
-                self.board_buttons[row][col].config(state='disabled')
+    def archive_game(self):
+        if not self.settings.get('game_archive'):
+            return
+        try:
+            append_game(self.settings['game_archive'], self.engine,
+                        FLAG_AI_O if self.settings['game_mode'] == 'ai' else 0)
+        except OSError:
+            pass
+    
+    def disable_board(self):
+        self.board_enabled = False
+        self.board_canvas.config(cursor='')
     
     def update_score_display(self):
         self.score_x_label.config(text=f"X: {self.game_state['score']['X']}")
@@ -700,6 +832,8 @@ class AdvancedCaroGame:
             self.show_hint()
         elif key == 'u' and self.current_screen == 'game':
             self.undo_move()
+        elif key == 'a' and self.current_screen == 'game':
+            self.toggle_analysis()
         elif key == 'q':
             self.quit_game()
         
@@ -713,6 +847,8 @@ class AdvancedCaroGame:
     
     def quit_game(self):
         if messagebox.askyesno("Thoát", "Bạn có chắc muốn thoát game?"):
+            self.cancel_ai_search()
+            self.engine.shutdown()
             self.save_settings_to_file()
             self.root.quit()
     
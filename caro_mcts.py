@@ -0,0 +1,432 @@
+"""Monte Carlo tree search (UCT) for large boards.
+
+Alpha-beta needs a narrow tree to look deep, and on big boards the tree is
+wide. MCTS grows its tree towards the lines its playouts find promising and
+keeps improving for as long as it runs, so it is an anytime player that
+scales with the time or iterations it is given.
+
+Each iteration walks down the tree by UCT and expands one move. Moves are
+expanded in the threat evaluator's order, and a node gets more children as
+its visit count grows (progressive widening). The new leaf is scored by a
+batch of random playouts that only place stones next to existing ones.
+Several walks are made per round, each leaving a virtual loss on its path so
+the next one spreads out, and the playouts of all their leaves are run
+together: with NumPy every game of the round advances one ply per array
+operation, without it they run one by one in plain Python. The tree lives
+for the whole game, so a search continues from what earlier searches, ponder
+searches and positions before an undo already explored.
+
+Examples:
+    python caro_mcts.py --size 15 --win 5 --moves "7,7 7,8" --time-ms 2000
+    python caro_mcts.py --size 19 --win 5 --iterations 400 --leaves 16 --python
+"""
+import argparse
+import math
+import random
+import sys
+import threading
+import time
+
+from caro_engine import BitBoard, CaroAI, CaroGame, CandidateMoves, other_player, parse_moves
+
+try:
+    import numpy as np
+except ImportError:  # optional: playouts fall back to pure Python
+    np = None
+
+
+class Node:
+    __slots__ = ('move', 'player', 'parent', 'children', 'untried', 'visits', 'wins', 'terminal')
+
+    def __init__(self, move, player, parent):
+        self.move = move
+        self.player = player  # who played move; wins are counted for this player
+        self.parent = parent
+        self.children = []
+        self.untried = None  # moves not expanded yet, best last so pop() takes it
+        self.visits = 0
+        self.wins = 0.0
+        self.terminal = None  # 1.0 when move won the game, 0.5 when it filled the board
+
+    def uct_child(self, exploration):
+        log_visits = math.log(self.visits)
+        return max(self.children,
+                   key=lambda child: child.wins / child.visits + exploration * math.sqrt(log_visits / child.visits))
+
+
+class MCTS:
+    EXPLORATION = 0.7  # UCT exploration constant, rewards are 0..1
+    WIDENING = 2.0  # a node may have 1 + WIDENING * sqrt(iterations through it) children
+    PLAYOUT_PLIES = 120  # playouts still undecided after this many moves count as draws
+    PROGRESS_SECONDS = 0.25  # how often on_progress is called
+
+    def __init__(self, size, win_condition, exact=False, batch=16, leaves=8, candidate_radius=2, use_numpy=True,
+                 seed=None):
+        self.size = size
+        self.win_condition = win_condition
+        self.exact = exact
+        self.batch = batch  # playouts per leaf
+        self.leaves = leaves  # leaves whose playouts are run together
+        self.candidate_radius = candidate_radius
+        self.use_numpy = use_numpy and np is not None
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()  # a cancelled search may still be finishing its batch
+        self.tree = None  # node of the first position searched, and that position
+        self.tree_board = None
+        self.root = None  # node of the position being searched
+        self.rollouts = 0
+        self.iterations = 0
+
+        cells = size * size
+        # Playouts only move next to stones: neighbours within one cell
+        self.neighbours = [[r * size + c for r, c in cell]
+                           for row in CandidateMoves.build_neighbours(size, 1) for cell in row]
+        self.cell_bits = [bit for row in BitBoard(size, win_condition).cell_bits for bit in row]
+        if self.use_numpy:
+            self.np_rng = np.random.default_rng(seed)
+            # Flat index tables padded with a sentinel cell (index cells) that is always empty
+            padded = [n + [cells] * (8 - len(n)) for n in self.neighbours]
+            self.neighbour_table = np.array(padded, dtype=np.intp)
+            # For every cell and direction, the 2 * win + 1 cells centred on it
+            lines = []
+            for index in range(cells):
+                row, col = divmod(index, size)
+                per_cell = []
+                for dr, dc in CaroAI.DIRECTIONS:
+                    per_line = []
+                    for k in range(-win_condition, win_condition + 1):
+                        r, c = row + k * dr, col + k * dc
+                        per_line.append(r * size + c if 0 <= r < size and 0 <= c < size else cells)
+                    per_cell.append(per_line)
+                lines.append(per_cell)
+            self.line_table = np.array(lines, dtype=np.intp)
+
+    # ===== TREE =====
+    def search(self, board, player, time_limit_ms=1000, max_iterations=0, cancel_event=None, on_progress=None,
+               root_moves=None):
+        # Returns (move, score, depth) for player. score is the best move's
+        # win rate mapped onto -1000..1000, depth the length of the main line.
+        with self.lock:
+            self.set_root(board, player, root_moves)
+            state = CaroAI(board, self.win_condition, candidate_radius=self.candidate_radius, symmetry=False,
+                           exact=self.exact)
+            started = time.perf_counter()
+            deadline = started + time_limit_ms / 1000.0
+            next_progress = started + self.PROGRESS_SECONDS
+            self.rollouts = self.iterations = 0
+            while True:
+                self.iterate(state)
+                self.iterations += self.leaves
+                now = time.perf_counter()
+                if max_iterations and self.iterations >= max_iterations:
+                    break
+                if now > deadline or (cancel_event is not None and cancel_event.is_set()):
+                    break
+                if self.decided():
+                    break
+                if on_progress is not None and now > next_progress:
+                    next_progress = now + self.PROGRESS_SECONDS
+                    on_progress(self.progress_info(started))
+            return self.result()
+
+    def set_root(self, board, player, root_moves=None):
+        # The tree is kept from the first position searched. Any later position
+        # reached from it by stones the tree has already explored, including
+        # one before an undo or a sibling of a pondered reply, reuses its node.
+        node = self.tree and self.find_node(board, player)
+        if node is None:
+            node = self.tree = Node(None, other_player(player), None)
+            self.tree_board = [row[:] for row in board]
+        if root_moves is not None:
+            # The same position always has the same forced defences
+            allowed = set(root_moves)
+            node.children = [child for child in node.children if child.move in allowed]
+            expanded = {child.move for child in node.children}
+            node.untried = [move for move in reversed(root_moves) if move not in expanded]
+        self.root = node
+
+    def find_node(self, board, player):
+        if len(board) != self.size:
+            return None
+        added = {}
+        for row in range(self.size):
+            for col in range(self.size):
+                old, new = self.tree_board[row][col], board[row][col]
+                if old != new:
+                    if old:
+                        return None
+                    added[(row, col)] = new
+        node = self.tree
+        while node is not None and added:
+            node = next((child for child in node.children if added.get(child.move) == child.player), None)
+            if node is not None:
+                del added[node.move]
+        if node is None or node.player == player:
+            return None  # off the tree, or the same stones with the other side to move
+        return node
+
+    def iterate(self, state):
+        # One round: several walks down the tree, then all their playouts in a
+        # single batch. Each walk adds its visits at once with no wins (a
+        # virtual loss), so the next walk of the round prefers other lines.
+        leaves, positions = [], []
+        for _ in range(self.leaves):
+            node = self.select(state)
+            leaves.append(node)
+            if node.terminal is None:
+                # Playouts start with the other side to move
+                positions.append(([row[:] for row in state.board], other_player(node.player)))
+            while node is not self.root:
+                state.remove(*node.move)
+                node = node.parent
+
+        rewards = iter(self.playouts(positions, self.batch))
+        self.rollouts += len(positions) * self.batch
+        for node in leaves:
+            # Wins are counted for the player who moved into the node
+            wins = node.terminal * self.batch if node.terminal is not None else self.batch - next(rewards)
+            while True:
+                node.wins += wins
+                if node is self.root:
+                    break
+                wins = self.batch - wins
+                node = node.parent
+
+    def select(self, state):
+        # Walks down by UCT, expanding one move on the way, and leaves the
+        # stones of the path on state
+        node = self.root
+        node.visits += self.batch
+        while node.terminal is None:
+            if node.untried is None:
+                node.untried = state.get_available_moves()[::-1]
+            allowed = 1 + int(self.WIDENING * math.sqrt(node.visits / self.batch))
+            if node.untried and len(node.children) < allowed:
+                row, col = node.untried.pop()
+                child = Node((row, col), other_player(node.player), node)
+                state.place(row, col, child.player)
+                if state.bitboard.is_win(child.player):
+                    child.terminal = 1.0
+                elif state.candidates.stone_count == self.size * self.size:
+                    child.terminal = 0.5
+                node.children.append(child)
+                child.visits += self.batch
+                return child
+            if not node.children:
+                node.terminal = 0.5  # no move left
+                break
+            node = node.uct_child(self.EXPLORATION)
+            node.visits += self.batch
+            state.place(node.move[0], node.move[1], node.player)
+        return node
+
+    def decided(self):
+        # Stop early once a move wins outright
+        return any(child.terminal == 1.0 for child in self.root.children)
+
+    def best_child(self):
+        wins = [child for child in self.root.children if child.terminal == 1.0]
+        if wins:
+            return wins[0]
+        return max(self.root.children, key=lambda child: child.visits) if self.root.children else None
+
+    def principal_variation(self, length=16):
+        # Most visited line from the root
+        line = []
+        node = self.best_child()
+        while node is not None and len(line) < length:
+            line.append(node.move)
+            node = max(node.children, key=lambda child: child.visits) if node.children else None
+        return line
+
+    def result(self):
+        child = self.best_child()
+        if child is None:
+            return None, 0, 0
+        rate = child.wins / child.visits if child.visits else child.terminal or 0.5
+        return child.move, int(round((2 * rate - 1) * 1000)), len(self.principal_variation())
+
+    def progress_info(self, started):
+        move, score, depth = self.result()
+        seconds = time.perf_counter() - started
+        return {
+            'depth': depth,
+            'move': move,
+            'score': score,
+            'nodes': self.rollouts,
+            'time': seconds,
+            'nps': self.rollouts / seconds if seconds else 0.0,
+            'pv': self.principal_variation()
+        }
+
+    # ===== PLAYOUTS =====
+    def playouts(self, positions, count):
+        # Total reward over count random games from each (board, player to move)
+        # position, for that player: 1 for a win, 0.5 for a draw
+        if not positions:
+            return []
+        if self.use_numpy:
+            return self.playouts_numpy(positions, count)
+        return [self.playouts_python(board, player, count) for board, player in positions]
+
+    def playouts_numpy(self, positions, count):
+        # All games of all positions advance together, one ply per round of
+        # array operations. Like the Python playouts, every game keeps a list
+        # of the free cells next to a stone and swap-removes a random entry, so
+        # a ply costs O(games) rather than O(games * cells). Finished games keep
+        # moving, which is cheaper than dropping their rows; only their first
+        # result counts.
+        size, cells, win = self.size, self.size * self.size, self.win_condition
+        stride = cells + 1
+        stones = np.zeros((len(positions), stride), dtype=np.int8)
+        stones[:, cells] = 3  # the sentinel is off the board: never free, never a player's
+        near = np.zeros((len(positions), stride), dtype=bool)
+        moves = np.zeros((len(positions), stride), dtype=np.intp)
+        counts = np.zeros(len(positions), dtype=np.intp)
+        to_move = np.zeros(len(positions), dtype=np.int8)
+        for index, (board, player) in enumerate(positions):
+            for cell in range(cells):
+                stone = board[cell // size][cell % size]
+                if stone:
+                    stones[index, cell] = 1 if stone == 'X' else 2
+                    near[index, self.neighbour_table[cell]] = True
+            if not near[index].any():
+                near[index, (size // 2) * size + size // 2] = True
+            near[index] &= stones[index] == 0
+            start = np.nonzero(near[index])[0]
+            moves[index, :start.size] = start
+            counts[index] = start.size
+            to_move[index] = 1 if player == 'X' else 2
+        free_cells = int((stones == 0).sum(axis=1).max())
+
+        # count games per position, addressed through one flat view: row offset + cell
+        games = len(positions) * count
+        offsets = (np.arange(games) * stride)[:, None]
+        boards = np.repeat(stones, count, axis=0).reshape(-1)
+        listed = np.repeat(near, count, axis=0).reshape(-1)
+        moves = np.repeat(moves, count, axis=0).reshape(-1)
+        counts = np.repeat(counts, count)
+        me = current = np.repeat(to_move, count)
+        reward = np.full(games, 0.5)
+        active = np.ones(games, dtype=bool)
+
+        for _ in range(min(free_cells, self.PLAYOUT_PLIES)):
+            active &= counts > 0  # no move left near the stones: a draw
+            pick = offsets[:, 0] + (self.np_rng.random(games) * counts).astype(np.intp)
+            cell = moves[pick]
+            counts = np.maximum(counts - 1, 0)
+            moves[pick] = moves[offsets[:, 0] + counts]
+            boards[offsets[:, 0] + cell] = current
+
+            around = offsets + self.neighbour_table[cell]
+            added = (boards[around] == 0) & ~listed[around]
+            listed[around[added]] = True
+            slots = offsets + counts[:, None] + np.cumsum(added, axis=1) - 1
+            moves[slots[added]] = around[added] - np.broadcast_to(offsets, added.shape)[added]
+            counts += added.sum(axis=1)
+
+            # Length of the run through cell in each direction, counting up to
+            # win stones each side so the exact rule can tell a five from a six
+            line = boards[offsets[:, :, None] + self.line_table[cell]] == current[:, None, None]
+            run = np.ones((games, 4), dtype=np.int8)
+            for side in (-1, 1):
+                alive = line[:, :, win + side].copy()
+                run += alive
+                for k in range(2, win + 1):
+                    alive &= line[:, :, win + side * k]
+                    run += alive
+            won = ((run == win) if self.exact else (run >= win)).any(axis=1) & active
+            reward[won] = current[won] == me[won]
+            active &= ~won
+            if not active.any():
+                break
+            current = 3 - current
+        return reward.reshape(len(positions), count).sum(axis=1).tolist()
+
+    def playouts_python(self, board, player, count):
+        size, cells = self.size, self.size * self.size
+        bitboard = BitBoard.from_board(board, self.win_condition, self.exact)
+        start_bits = dict(bitboard.bits)
+        start_occupied = [board[index // size][index % size] != '' for index in range(cells)]
+        start_near = [0] * cells
+        for index in range(cells):
+            if start_occupied[index]:
+                for n in self.neighbours[index]:
+                    start_near[n] += 1
+        free_cells = start_occupied.count(False)
+        start_moves = [index for index in range(cells) if not start_occupied[index] and start_near[index]]
+        if not start_moves and free_cells:
+            start_moves = [(size // 2) * size + size // 2]
+        opponent = other_player(player)
+        neighbours, cell_bits, rng = self.neighbours, self.cell_bits, self.rng
+
+        reward = 0.0
+        for _ in range(count):
+            bitboard.bits = dict(start_bits)
+            occupied = start_occupied[:]
+            near = start_near[:]
+            moves = start_moves[:]
+            position = {cell: k for k, cell in enumerate(moves)}
+            current, result = player, 0.5
+            for _ in range(min(free_cells, self.PLAYOUT_PLIES)):
+                if not moves:
+                    break
+                # Swap-remove a random candidate so every step is O(1)
+                k = rng.randrange(len(moves))
+                cell = moves[k]
+                last = moves.pop()
+                if last != cell:
+                    moves[k] = last
+                    position[last] = k
+                del position[cell]
+                occupied[cell] = True
+                bitboard.bits[current] |= cell_bits[cell]
+                if bitboard.is_win(current):
+                    result = 1.0 if current == player else 0.0
+                    break
+                for n in neighbours[cell]:
+                    near[n] += 1
+                    if near[n] == 1 and not occupied[n]:
+                        position[n] = len(moves)
+                        moves.append(n)
+                current = opponent if current == player else player
+            reward += result
+        return reward
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Caro Monte Carlo tree search')
+    parser.add_argument('--size', type=int, required=True)
+    parser.add_argument('--win', type=int, required=True)
+    parser.add_argument('--rule', choices=['freestyle', 'exact'], default='freestyle')
+    parser.add_argument('--moves', default='', help='moves played so far, X first, e.g. "7,7 7,8"')
+    parser.add_argument('--time-ms', type=int, default=1000)
+    parser.add_argument('--iterations', type=int, default=0, help='stop after this many leaves (0: time only)')
+    parser.add_argument('--batch', type=int, default=16, help='playouts per expanded leaf')
+    parser.add_argument('--leaves', type=int, default=8, help='leaves whose playouts run as one batch')
+    parser.add_argument('--python', action='store_true', help='pure-Python playouts even when NumPy is installed')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+
+    game = CaroGame({'board_size': args.size, 'win_condition': args.win, 'win_rule': args.rule})
+    for row, col in parse_moves(args.moves):
+        game.play(row, col)
+    mcts = MCTS(args.size, args.win, args.rule == 'exact', args.batch, args.leaves, use_numpy=not args.python,
+                seed=args.seed)
+    started = time.perf_counter()
+    move, score, depth = mcts.search(game.board, game.current_player, args.time_ms, args.iterations)
+    seconds = time.perf_counter() - started
+    if move is None:
+        print('no move')
+        return 1
+    print('%d %d: score %d, %d iterations, %d playouts in %.2f s (%.0f/s, %s)' % (
+        move[0], move[1], score, mcts.iterations, mcts.rollouts, seconds, mcts.rollouts / seconds if seconds else 0,
+        'NumPy' if mcts.use_numpy else 'Python'))
+    print('pv %s' % ' '.join('%d,%d' % m for m in mcts.principal_variation()))
+    for child in sorted(mcts.root.children, key=lambda child: -child.visits)[:5]:
+        print('  %d,%d  visits %6d  win rate %.3f' % (child.move + (child.visits, child.wins / child.visits)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""Compact game records: settings plus moves, streamed to and from disk.
+
+A record file is a short header followed by games back to back. Each game is
+a 6-byte header (board size, win condition, result, flags, move count) and
+one cell index per move: a byte on boards up to 16x16, two bytes above. Moves
+alternate from X, so players are not stored. A 15x15 game of 60 moves takes
+66 bytes. The flags say which sides the AI played and whether the game used
+the exact-N win rule. Files are read and written sequentially, so archives of millions of
+games never have to fit in memory.
+
+Examples:
+    python caro_record.py info --input caro_games.bin
+    python caro_record.py show --input caro_games.bin --game 0 --ply 10
+    python caro_record.py export --input caro_games.bin --output games.jsonl
+    python caro_record.py import --input games.jsonl --output caro_games.bin
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+from array import array
+from collections import Counter, namedtuple
+
+from caro_engine import CaroGame
+
+
+MAGIC = b'CARG'
+VERSION = 2  # 2 added FLAG_EXACT; version 1 files hold freestyle games only
+FILE_HEADER = struct.Struct('<4sBxxx')  # magic, version
+GAME_HEADER = struct.Struct('<BBBBH')  # size, win, result, flags, move count
+RESULTS = {None: 0, 'X': 1, 'O': 2, 'draw': 3}
+RESULT_NAMES = {code: name for name, code in RESULTS.items()}
+FLAG_AI_X, FLAG_AI_O = 1, 2  # which side the AI played, if any
+FLAG_EXACT = 4  # exact-N win rule: an overline does not win
+
+GameRecord = namedtuple('GameRecord', 'size win result moves flags rule', defaults=('freestyle',))
+
+
+def cell_type(size):
+    return 'B' if size * size <= 256 else 'H'
+
+
+def record_from_game(game, flags=0):
+    # Snapshot of a CaroGame; result is 'X', 'O', 'draw' or None (unfinished)
+    if game.winner:
+        result = game.winner
+    elif game.bitboard.is_full():
+        result = 'draw'
+    else:
+        result = None
+    return GameRecord(game.size, game.win_condition, result, [(row, col) for row, col, _ in game.move_history], flags,
+                      game.settings['win_rule'])
+
+
+class GameWriter:
+    def __init__(self, path, append=False):
+        # Appending to an existing archive keeps its games. A version 1 header
+        # is upgraded in place: its games are valid version 2 games.
+        append = append and os.path.exists(path)
+        self.file = open(path, 'r+b' if append else 'wb')
+        header = self.file.read(FILE_HEADER.size) if append else b''
+        if len(header) < FILE_HEADER.size:
+            self.file.seek(0)
+            self.file.truncate()
+            self.file.write(FILE_HEADER.pack(MAGIC, VERSION))
+        else:
+            magic, version = FILE_HEADER.unpack(header)
+            if magic != MAGIC or version > VERSION:
+                self.file.close()
+                raise ValueError('%s is not a game record file' % path)
+            if version < VERSION:
+                self.file.seek(0)
+                self.file.write(FILE_HEADER.pack(MAGIC, VERSION))
+            self.file.seek(0, os.SEEK_END)
+        self.count = 0
+
+    def write(self, size, win_condition, moves, result=None, flags=0, rule='freestyle'):
+        if len(moves) > size * size:
+            raise ValueError('more moves than cells')
+        cells = array(cell_type(size), (row * size + col for row, col in moves))
+        if sys.byteorder != 'little':
+            cells.byteswap()
+        flags = flags & ~FLAG_EXACT | (FLAG_EXACT if rule == 'exact' else 0)
+        self.file.write(GAME_HEADER.pack(size, win_condition, RESULTS[result], flags, len(cells)))
+        self.file.write(cells.tobytes())
+        self.count += 1
+
+    def write_record(self, record):
+        self.write(record.size, record.win, record.moves, record.result, record.flags, record.rule)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class GameReader:
+    # Iterates GameRecords one at a time through a buffered file
+    def __init__(self, path):
+        self.path = path
+
+    def __iter__(self):
+        with open(self.path, 'rb') as f:
+            header = f.read(FILE_HEADER.size)
+            if len(header) < FILE_HEADER.size:
+                return
+            magic, version = FILE_HEADER.unpack(header)
+            if magic != MAGIC or not 1 <= version <= VERSION:
+                raise ValueError('%s is not a game record file' % self.path)
+            while True:
+                header = f.read(GAME_HEADER.size)
+                if len(header) < GAME_HEADER.size:
+                    return  # end of file, or a game cut off by a crash mid-write
+                size, win_condition, result, flags, count = GAME_HEADER.unpack(header)
+                cells = array(cell_type(size))
+                data = f.read(count * cells.itemsize)
+                if len(data) < count * cells.itemsize:
+                    return
+                cells.frombytes(data)
+                if sys.byteorder != 'little':
+                    cells.byteswap()
+                yield GameRecord(size, win_condition, RESULT_NAMES[result],
+                                 [divmod(cell, size) for cell in cells], flags,
+                                 'exact' if flags & FLAG_EXACT else 'freestyle')
+
+
+def append_game(path, game, flags=0):
+    # One finished game onto an archive, creating it if needed
+    with GameWriter(path, append=True) as writer:
+        writer.write_record(record_from_game(game, flags))
+
+
+def replay(record, ply=None, settings=None):
+    # CaroGame at `ply` moves into the record (the end by default), without any UI
+    game_settings = dict(settings or {})
+    game_settings.update(board_size=record.size, win_condition=record.win, win_rule=record.rule)
+    game = CaroGame(game_settings)
+    for row, col in record.moves[:ply]:
+        if game.play(row, col) is not None:
+            break
+    return game
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Caro game records')
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name in ('info', 'show', 'export', 'import'):
+        sub = commands.add_parser(name)
+        sub.add_argument('--input', required=True)
+        if name == 'show':
+            sub.add_argument('--game', type=int, default=0, help='index of the game in the file')
+            sub.add_argument('--ply', type=int, help='position after this many moves (default: the end)')
+        if name in ('export', 'import'):
+            sub.add_argument('--output', required=True)
+    args = parser.parse_args(argv)
+
+    if args.command == 'info':
+        games = moves = 0
+        configs, results = Counter(), Counter()
+        for record in GameReader(args.input):
+            games += 1
+            moves += len(record.moves)
+            configs['%dx%d/%d %s' % (record.size, record.size, record.win, record.rule)] += 1
+            results[record.result or 'unfinished'] += 1
+        print('%s: %d games, %.1f moves/game' % (args.input, games, moves / games if games else 0))
+        for name, count in sorted(configs.items()):
+            print('  %s: %d' % (name, count))
+        print('  results: %s' % ', '.join('%s %d' % item for item in sorted(results.items())))
+    elif args.command == 'show':
+        for index, record in enumerate(GameReader(args.input)):
+            if index == args.game:
+                game = replay(record, args.ply)
+                print(game)
+                print('%d/%d moves, %s rule, result %s' % (len(game.move_history), len(record.moves), record.rule,
+                                                           record.result or 'unfinished'))
+                return 0
+        print('no game %d' % args.game)
+        return 1
+    elif args.command == 'export':
+        with open(args.output, 'w') as f:
+            for record in GameReader(args.input):
+                f.write(json.dumps({'size': record.size, 'win': record.win, 'rule': record.rule,
+                                    'result': record.result, 'moves': record.moves, 'flags': record.flags}) + '\n')
+    else:
+        with open(args.input) as f, GameWriter(args.output) as writer:
+            for line in f:
+                if line.strip():
+                    game = json.loads(line)
+                    writer.write(game['size'], game['win'], [tuple(move) for move in game['moves']],
+                                 game.get('result'), game.get('flags', 0), game.get('rule', 'freestyle'))
+        print('%s: %d games' % (args.output, writer.count))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,233 @@
+"""Self-play tournament: engine A against engine B over many headless games.
+
+Games are spread over worker processes. The report gives A's score with an Elo
+difference and 95% confidence interval, average move time and nodes per
+second for each side, per board configuration and overall.
+
+Examples:
+    python caro_selfplay.py --engine-a hard:300 --engine-b medium --games 200
+    python caro_selfplay.py --engine-a hard:200 --engine-b hard:50 --sizes 10 15 --wins 5 --json
+    python caro_selfplay.py --engine-a mcts:500 --engine-b hard:500 --sizes 15 19 --wins 5
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from caro_engine import CaroGame
+from caro_record import FLAG_AI_O, FLAG_AI_X, GameWriter
+
+
+def parse_engine(spec):
+    # "hard:300" -> {'ai_difficulty': 'hard', 'ai_engine': 'alphabeta', 'ai_time_limit_ms': 300}.
+    # "mcts" is the hard AI with Monte Carlo tree search.
+    difficulty, _, time_ms = spec.partition(':')
+    if difficulty not in ('easy', 'medium', 'hard', 'mcts'):
+        raise ValueError('unknown difficulty: %s' % difficulty)
+    engine = {'ai_difficulty': 'hard' if difficulty == 'mcts' else difficulty,
+              'ai_engine': 'mcts' if difficulty == 'mcts' else 'alphabeta'}
+    if time_ms:
+        engine['ai_time_limit_ms'] = int(time_ms)
+    return engine
+
+
+def play_game(job):
+    # Runs in a worker process. job['a_plays'] says which colour engine A has.
+    # Each side gets its own CaroGame, so neither engine reads the other's
+    # transposition table, search context, solved table or MCTS tree; every
+    # move is played on both.
+    random.seed(job['seed'])
+    engines = {'X': job['engine_a'], 'O': job['engine_b']}
+    if job['a_plays'] == 'O':
+        engines = {'X': job['engine_b'], 'O': job['engine_a']}
+    games = {}
+    for player in ('X', 'O'):
+        settings = {'board_size': job['size'], 'win_condition': job['win'], 'win_rule': job['rule'], 'ai_workers': 1}
+        settings.update(engines[player])
+        games[player] = CaroGame(settings)
+    game = games['X']  # the reference board; both games always hold the same moves
+
+    # A few random opening moves near the centre so repeated games differ
+    center = job['size'] // 2
+    spread = max(1, job['size'] // 4)
+    for _ in range(job['random_opening']):
+        row = random.randint(max(0, center - spread), min(job['size'] - 1, center + spread))
+        col = random.randint(max(0, center - spread), min(job['size'] - 1, center + spread))
+        if game.is_legal(row, col):
+            games['O'].play(row, col)
+            if game.play(row, col) is not None:
+                break
+
+    stats = {player: {'moves': 0, 'time': 0.0, 'search_time': 0.0, 'nodes': 0} for player in ('X', 'O')}
+    result = None if game.winner is None and not game.bitboard.is_full() else 'done'
+    while result is None:
+        player = game.current_player
+        engine = games[player]
+        engine.last_search = None
+        started = time.perf_counter()
+        row, col = engine.best_move()
+        stats[player]['time'] += time.perf_counter() - started
+        stats[player]['moves'] += 1
+        if engine.last_search is not None:
+            stats[player]['search_time'] += engine.last_search['time']
+            stats[player]['nodes'] += engine.last_search['nodes']
+        games['O'].play(row, col)
+        result = game.play(row, col)
+    for side in games.values():
+        side.shutdown()
+
+    a_color = job['a_plays']
+    if game.winner is None:
+        score = 0.5
+    else:
+        score = 1.0 if game.winner == a_color else 0.0
+    return {
+        'size': job['size'],
+        'win': job['win'],
+        'rule': job['rule'],
+        'score': score,
+        'length': len(game.move_history),
+        'moves': [(row, col) for row, col, _ in game.move_history],
+        'result': game.winner or 'draw',
+        'a': stats[a_color],
+        'b': stats['O' if a_color == 'X' else 'X']
+    }
+
+
+def elo_from_score(score, games):
+    # A perfect score has no finite Elo; clamp to half a game from either end
+    bound = 0.5 / games
+    score = min(max(score, bound), 1 - bound)
+    return -400 * math.log10(1 / score - 1)
+
+
+def score_interval(score, games, z=1.96):
+    # Wilson score interval: unlike mean +- z * stddev it keeps a real width
+    # when every game had the same result
+    denominator = 1 + z * z / games
+    center = (score + z * z / (2 * games)) / denominator
+    margin = z * math.sqrt(score * (1 - score) / games + z * z / (4 * games * games)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def summarise(results):
+    n = len(results)
+    wins = sum(1 for r in results if r['score'] == 1.0)
+    draws = sum(1 for r in results if r['score'] == 0.5)
+    mean = sum(r['score'] for r in results) / n
+    low, high = score_interval(mean, n)
+
+    summary = {
+        'games': n,
+        'wins': wins,
+        'draws': draws,
+        'losses': n - wins - draws,
+        'score': mean,
+        'elo': elo_from_score(mean, n),
+        'elo_low': elo_from_score(low, n),
+        'elo_high': elo_from_score(high, n),
+        'avg_length': sum(r['length'] for r in results) / n
+    }
+    for side in ('a', 'b'):
+        moves = sum(r[side]['moves'] for r in results)
+        move_time = sum(r[side]['time'] for r in results)
+        search_time = sum(r[side]['search_time'] for r in results)
+        nodes = sum(r[side]['nodes'] for r in results)
+        summary[side] = {
+            'avg_move_ms': move_time / moves * 1000 if moves else 0.0,
+            'nodes_per_second': nodes / search_time if search_time else 0.0
+        }
+    return summary
+
+
+def format_summary(title, summary):
+    lines = [
+        '%s: %d games, A +%d =%d -%d, score %.1f%%, Elo %+.0f [%+.0f, %+.0f], %.1f moves/game' % (
+            title, summary['games'], summary['wins'], summary['draws'], summary['losses'],
+            summary['score'] * 100, summary['elo'], summary['elo_low'], summary['elo_high'],
+            summary['avg_length'])
+    ]
+    for side in ('a', 'b'):
+        lines.append('  %s: %.1f ms/move, %.0f nodes/s' % (
+            side.upper(), summary[side]['avg_move_ms'], summary[side]['nodes_per_second']))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Caro engine self-play tournament')
+    parser.add_argument('--engine-a', default='hard', help='difficulty[:time_ms], e.g. hard:300 or mcts:500')
+    parser.add_argument('--engine-b', default='medium', help='difficulty[:time_ms]')
+    parser.add_argument('--games', type=int, default=100, help='games per board configuration')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10], help='board sizes')
+    parser.add_argument('--wins', type=int, nargs='+', default=[5], help='win conditions')
+    parser.add_argument('--rule', choices=['freestyle', 'exact'], default='freestyle', help='exact: an overline does not win')
+    parser.add_argument('--random-opening', type=int, default=2, help='random moves played before the engines take over')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='worker processes')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('--record', help='also save every game to this record file (see caro_record.py)')
+    args = parser.parse_args(argv)
+    try:
+        engine_a, engine_b = parse_engine(args.engine_a), parse_engine(args.engine_b)
+    except ValueError as e:
+        parser.error(str(e))
+
+    configs = [(size, win) for size in args.sizes for win in args.wins if win <= size]
+    if not configs:
+        parser.error('no win condition fits the given board sizes')
+    jobs = []
+    for size, win in configs:
+        for i in range(args.games):
+            jobs.append({
+                'size': size,
+                'win': win,
+                'rule': args.rule,
+                'engine_a': engine_a,
+                'engine_b': engine_b,
+                'a_plays': 'X' if i % 2 == 0 else 'O',
+                'random_opening': args.random_opening,
+                'seed': args.seed * 1000003 + len(jobs)
+            })
+
+    started = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for result in executor.map(play_game, jobs, chunksize=max(1, len(jobs) // (args.workers * 8))):
+            results.append(result)
+            if not args.json and len(results) % 10 == 0:
+                print('%d/%d games' % (len(results), len(jobs)), file=sys.stderr)
+    elapsed = time.perf_counter() - started
+    if args.record:
+        with GameWriter(args.record) as writer:
+            for result in results:
+                writer.write(result['size'], result['win'], result['moves'], result['result'], FLAG_AI_X | FLAG_AI_O,
+                             result['rule'])
+
+    report = {
+        'engine_a': args.engine_a,
+        'engine_b': args.engine_b,
+        'elapsed_s': elapsed,
+        'configs': {},
+        'overall': summarise(results)
+    }
+    for size, win in configs:
+        subset = [r for r in results if r['size'] == size and r['win'] == win]
+        report['configs']['%dx%d/%d' % (size, size, win)] = summarise(subset)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print('A = %s, B = %s, %.1f s' % (args.engine_a, args.engine_b, elapsed))
+        for name, summary in report['configs'].items():
+            print(format_summary(name, summary))
+        if len(configs) > 1:
+            print(format_summary('overall', report['overall']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
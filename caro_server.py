@@ -0,0 +1,338 @@
+"""HTTP JSON server hosting many concurrent games against the AI.
+
+Every session keeps its CaroGame in memory. AI moves run in a bounded pool of
+worker processes. Once --max-pending searches are queued or running, new moves
+are refused with 503 so clients back off instead of piling up latency.
+
+Endpoints:
+    POST   /games              {"size": 15, "win": 5, "rule": "freestyle", "difficulty": "hard", "time_ms": 500,
+                                "engine": "alphabeta", "ai_first": false}
+    GET    /games/<id>
+    POST   /games/<id>/moves   {"row": 7, "col": 7}
+    DELETE /games/<id>
+    GET    /stats
+
+Examples:
+    python caro_server.py --port 8765 --workers 4
+    curl -X POST localhost:8765/games -d '{"size": 15, "win": 5}'
+    curl -X POST localhost:8765/games/<id>/moves -d '{"row": 7, "col": 7}'
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from caro_engine import CaroGame
+
+
+MAX_BODY = 64 * 1024
+MAX_SIZE = 19
+REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           409: 'Conflict', 413: 'Payload Too Large', 503: 'Service Unavailable'}
+
+_worker_games = {}
+
+
+def init_worker():
+    # Ctrl+C reaches the whole process group; the server shuts the pool down itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def ai_move(job):
+    # Runs in a worker process. One game per board configuration is kept so its
+    # transposition table, book and solved table carry over between requests.
+    key = (job['size'], job['win'], job['rule'])
+    game = _worker_games.get(key)
+    if game is None:
+        game = CaroGame({'board_size': job['size'], 'win_condition': job['win'], 'win_rule': job['rule'],
+                         'ai_workers': 1})
+        _worker_games[key] = game
+    game.settings['ai_difficulty'] = job['difficulty']
+    game.settings['ai_engine'] = job['engine']
+    game.settings['ai_time_limit_ms'] = job['time_ms']
+    game.settings['ai_analysis_cache'] = job['cache']  # one SQLite file shared by all workers
+    game.reset()
+    for row, col in job['moves']:
+        game.play(row, col)
+    game.last_search = None
+    started = time.perf_counter()
+    move = game.best_move()
+    search = game.last_search or {}
+    return move, {
+        'time_ms': round((time.perf_counter() - started) * 1000, 1),
+        'nodes': search.get('nodes', 0),
+        'depth': search.get('depth', 0)
+    }
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Session:
+    def __init__(self, game, ai_player, difficulty, time_ms, engine='alphabeta'):
+        self.id = uuid.uuid4().hex[:12]
+        self.game = game
+        self.ai_player = ai_player
+        self.difficulty = difficulty
+        self.engine = engine
+        self.time_ms = time_ms
+        self.lock = asyncio.Lock()  # one move at a time per game
+        self.last_used = time.monotonic()
+        self.last_ai = None
+
+    def state(self):
+        game = self.game
+        finished = game.winner is not None or game.bitboard.is_full()
+        return {
+            'id': self.id,
+            'size': game.size,
+            'win': game.win_condition,
+            'rule': game.settings['win_rule'],
+            'board': [''.join(cell or '.' for cell in row) for row in game.board],
+            'moves': [[row, col] for row, col, _ in game.move_history],
+            'to_move': None if finished else game.current_player,
+            'ai_player': self.ai_player,
+            'winner': game.winner,
+            'winning_cells': [list(cell) for cell in game.winning_cells()],
+            'finished': finished,
+            'ai': self.last_ai
+        }
+
+
+class CaroServer:
+    def __init__(self, workers=1, max_pending=None, max_sessions=1000, idle_timeout=1800, max_time_ms=2000,
+                 cache=None):
+        self.workers = workers
+        self.max_pending = max_pending or workers * 8
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_time_ms = max_time_ms
+        self.cache = cache
+        # Spawned, not forked: workers start on the first AI request, after the
+        # port is bound, and a forked worker would inherit the listening socket
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=init_worker)
+        self.sessions = {}
+        self.pending = 0
+        self.stats = {'games': 0, 'moves': 0, 'searches': 0, 'rejected': 0, 'search_ms': 0.0}
+
+    # ===== HTTP =====
+    async def handle(self, reader, writer):
+        try:
+            status, payload = await self.respond(reader)
+        except HTTPError as e:
+            status, payload = e.status, {'error': str(e)}
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            # Client went away, or the server is shutting down mid-request
+            writer.close()
+            return
+        body = json.dumps(payload).encode()
+        head = 'HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\nConnection: close\r\n' % (
+            status, REASONS.get(status, ''), len(body))
+        if status == 503:
+            head += 'Retry-After: 1\r\n'
+        try:
+            writer.write(head.encode() + b'\r\n' + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, reader):
+        request_line = (await reader.readline()).decode('latin-1').split()
+        if len(request_line) != 3:
+            raise HTTPError(400, 'malformed request line')
+        method, path = request_line[0], request_line[1].split('?')[0].rstrip('/')
+        length = 0
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'content-length':
+                try:
+                    length = int(value)
+                except ValueError:
+                    raise HTTPError(400, 'bad Content-Length')
+        if length > MAX_BODY:
+            raise HTTPError(413, 'body too large')
+        body = {}
+        if length:
+            try:
+                body = json.loads(await reader.readexactly(length))
+            except ValueError:
+                raise HTTPError(400, 'body is not JSON')
+            if not isinstance(body, dict):
+                raise HTTPError(400, 'body must be a JSON object')
+        return await self.route(method, path.strip('/').split('/'), body)
+
+    async def route(self, method, parts, body):
+        if parts == ['stats'] and method == 'GET':
+            return 200, dict(self.stats, sessions=len(self.sessions), pending=self.pending, workers=self.workers)
+        if parts[0] != 'games' or len(parts) > 3:
+            raise HTTPError(404, 'not found')
+        if len(parts) == 1:
+            if method != 'POST':
+                raise HTTPError(405, 'use POST to create a game')
+            return 201, await self.create_game(body)
+
+        session = self.sessions.get(parts[1])
+        if session is None:
+            raise HTTPError(404, 'no such game')
+        session.last_used = time.monotonic()
+        if len(parts) == 3:
+            if parts[2] != 'moves' or method != 'POST':
+                raise HTTPError(404, 'not found')
+            return 200, await self.play_move(session, body)
+        if method == 'GET':
+            return 200, session.state()
+        if method == 'DELETE':
+            del self.sessions[session.id]
+            return 200, {'deleted': session.id}
+        raise HTTPError(405, 'method not allowed')
+
+    # ===== GAMES =====
+    def int_field(self, body, name, default, low, high):
+        value = body.get(name, default)
+        if not isinstance(value, int) or isinstance(value, bool) or not low <= value <= high:
+            raise HTTPError(400, '%s must be an integer from %d to %d' % (name, low, high))
+        return value
+
+    async def create_game(self, body):
+        if len(self.sessions) >= self.max_sessions:
+            self.stats['rejected'] += 1
+            raise HTTPError(503, 'too many games')
+        size = self.int_field(body, 'size', 15, 3, MAX_SIZE)
+        win = self.int_field(body, 'win', min(5, size), 3, size)
+        time_ms = self.int_field(body, 'time_ms', min(1000, self.max_time_ms), 10, self.max_time_ms)
+        difficulty = body.get('difficulty', 'hard')
+        if difficulty not in ('easy', 'medium', 'hard'):
+            raise HTTPError(400, 'difficulty must be easy, medium or hard')
+        engine = body.get('engine', 'alphabeta')
+        if engine not in ('alphabeta', 'mcts'):
+            raise HTTPError(400, 'engine must be alphabeta or mcts')
+        rule = body.get('rule', 'freestyle')
+        if rule not in ('freestyle', 'exact'):
+            raise HTTPError(400, 'rule must be freestyle or exact')
+
+        game = CaroGame({'board_size': size, 'win_condition': win, 'win_rule': rule})
+        session = Session(game, 'X' if body.get('ai_first') else 'O', difficulty, time_ms, engine)
+        if session.ai_player == 'X':
+            self.check_capacity()
+        self.sessions[session.id] = session
+        self.stats['games'] += 1
+        if session.ai_player == 'X':
+            async with session.lock:
+                await self.run_ai(session)
+        return session.state()
+
+    async def play_move(self, session, body):
+        row = self.int_field(body, 'row', None, 0, session.game.size - 1)
+        col = self.int_field(body, 'col', None, 0, session.game.size - 1)
+        if session.lock.locked():
+            raise HTTPError(409, 'a move is already being played in this game')
+        async with session.lock:
+            game = session.game
+            if game.current_player == session.ai_player:
+                raise HTTPError(409, 'not your turn')
+            if not game.is_legal(row, col):
+                raise HTTPError(400, 'illegal move')
+            # Refuse before playing, so a busy server never leaves a game half-moved
+            self.check_capacity()
+            game.play(row, col)
+            self.stats['moves'] += 1
+            await self.run_ai(session)
+        return session.state()
+
+    def check_capacity(self):
+        if self.pending >= self.max_pending:
+            self.stats['rejected'] += 1
+            raise HTTPError(503, 'server busy, retry shortly')
+
+    async def run_ai(self, session):
+        game = session.game
+        if game.winner is not None or game.bitboard.is_full():
+            return
+        self.check_capacity()
+        job = {
+            'size': game.size,
+            'win': game.win_condition,
+            'rule': game.settings['win_rule'],
+            'difficulty': session.difficulty,
+            'engine': session.engine,
+            'time_ms': session.time_ms,
+            'cache': self.cache,
+            'moves': [(row, col) for row, col, _ in game.move_history]
+        }
+        self.pending += 1
+        try:
+            move, info = await asyncio.get_running_loop().run_in_executor(self.executor, ai_move, job)
+        finally:
+            self.pending -= 1
+        self.stats['searches'] += 1
+        self.stats['search_ms'] += info['time_ms']
+        if move is not None and session.id in self.sessions:
+            game.play(*move)
+            session.last_ai = dict(info, move=list(move), player=game.move_history[-1][2])
+
+    async def expire_sessions(self):
+        while True:
+            await asyncio.sleep(min(60, self.idle_timeout))
+            cutoff = time.monotonic() - self.idle_timeout
+            for session_id in [s.id for s in self.sessions.values() if s.last_used < cutoff and not s.lock.locked()]:
+                del self.sessions[session_id]
+
+    async def serve(self, host, port):
+        # SIGTERM and SIGINT stop the loop so the pool is shut down, not orphaned
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(signum, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows: Ctrl+C still arrives as KeyboardInterrupt
+        server = await asyncio.start_server(self.handle, host, port)
+        expiry = asyncio.create_task(self.expire_sessions())
+        print('serving on http://%s:%d with %d worker(s)' % (host, port, self.workers), file=sys.stderr)
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            expiry.cancel()
+            # Running searches end within max_time_ms; queued ones are dropped
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Caro multi-game HTTP JSON server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='AI worker processes')
+    parser.add_argument('--max-pending', type=int, help='queued plus running searches before 503 (default 8 per worker)')
+    parser.add_argument('--max-sessions', type=int, default=1000, help='games kept in memory')
+    parser.add_argument('--idle-timeout', type=int, default=1800, help='seconds before an idle game is dropped')
+    parser.add_argument('--max-time-ms', type=int, default=2000, help='largest search budget a client may ask for')
+    parser.add_argument('--cache', help='SQLite analysis cache shared by the workers and later runs')
+    args = parser.parse_args(argv)
+
+    server = CaroServer(args.workers, args.max_pending, args.max_sessions, args.idle_timeout, args.max_time_ms,
+                        args.cache)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,292 @@
+"""Exact solver and precomputed result tables for small boards.
+
+Values are from the side to move's point of view. A win in d plies scores
+WIN - d, a loss in d plies scores -(WIN - d), and a draw scores 0. Taking the
+maximum therefore prefers the fastest win, then a draw, then the slowest loss.
+
+Solved tables use the opening book's file layout, with a different magic.
+The score field holds the value and the depth field holds the distance to the
+result. Positions are keyed by their symmetry-canonical hash.
+
+Examples:
+    python caro_solver.py generate --size 4 --win 4
+    python caro_solver.py solve --size 5 --win 4 --moves "2,2 1,1 2,3" --time-ms 5000
+"""
+import argparse
+import os
+import sys
+import time
+
+from caro_book import OpeningBook
+from caro_engine import BitBoard, CaroAI, CaroGame, SearchTimeout, other_player, parse_moves, symmetry_maps
+
+
+MAX_SIZE = 5  # largest board the solver is used on
+
+
+def table_path(size, win_condition, directory='.'):
+    return os.path.join(directory, 'caro_table_%dx%d_%d.bin' % (size, size, win_condition))
+
+
+class SolvedTable(OpeningBook):
+    MAGIC = b'CARS'
+
+    def lookup(self, board):
+        # Draws are stored without a distance: they last until the board is full
+        entry = super().lookup(board)
+        if entry is not None and entry[1] == 0:
+            entry = entry[0], 0, sum(row.count('') for row in board)
+        return entry
+
+
+class Solver:
+    WIN = 1000
+    EXACT, LOWER, UPPER = 0, 1, 2
+    CHECK_EVERY = 1024
+
+    def __init__(self, board, win_condition, time_limit_ms=None, cancel_event=None, exact=False):
+        self.size = len(board)
+        self.board = [row[:] for row in board]
+        self.bitboard = BitBoard.from_board(board, win_condition, exact)
+        self.symmetry_maps, self.symmetry_inverses = symmetry_maps(self.size)
+        self.cell_keys = CaroAI.symmetric_zobrist_keys(self.size, 8)
+        self.hashes = [0] * 8
+        self.empty_count = 0
+        for row in range(self.size):
+            for col in range(self.size):
+                if board[row][col]:
+                    self.hashes = [h ^ k for h, k in zip(self.hashes, self.cell_keys[board[row][col]][row][col])]
+                else:
+                    self.empty_count += 1
+        center = (self.size - 1) / 2
+        self.cells = sorted(((row, col) for row in range(self.size) for col in range(self.size)),
+                            key=lambda cell: abs(cell[0] - center) + abs(cell[1] - center))
+        self.deadline = time.perf_counter() + time_limit_ms / 1000.0 if time_limit_ms else None
+        self.cancel_event = cancel_event
+        self.table = {}
+        self.nodes = 0
+
+    def place(self, row, col, player):
+        self.board[row][col] = player
+        self.bitboard.place(row, col, player)
+        self.hashes = [h ^ k for h, k in zip(self.hashes, self.cell_keys[player][row][col])]
+        self.empty_count -= 1
+
+    def remove(self, row, col, player):
+        self.board[row][col] = ''
+        self.bitboard.remove(row, col, player)
+        self.hashes = [h ^ k for h, k in zip(self.hashes, self.cell_keys[player][row][col])]
+        self.empty_count += 1
+
+    def position_key(self):
+        key = min(self.hashes)
+        return key, self.hashes.index(key)
+
+    def winning_moves(self, player):
+        board = self.board
+        bitboard = self.bitboard
+        wins = []
+        for row, col in self.cells:
+            if board[row][col] == '':
+                bitboard.place(row, col, player)
+                if bitboard.is_win(player):
+                    wins.append((row, col))
+                bitboard.remove(row, col, player)
+        return wins
+
+    def forcing_moves(self, player):
+        # Only a block makes sense when the opponent threatens to win next move:
+        # any other move loses in 2 plies, which a blocking move cannot beat
+        threats = self.winning_moves(other_player(player))
+        return threats or self.moves()
+
+    def moves(self):
+        board = self.board
+        moves = [(row, col) for row, col in self.cells if board[row][col] == '']
+        # Symmetric positions (always true for the empty board) need one move per group
+        symmetries = [s for s in range(1, 8) if self.hashes[s] == self.hashes[0]]
+        if symmetries:
+            seen = set()
+            unique = []
+            for row, col in moves:
+                if (row, col) not in seen:
+                    unique.append((row, col))
+                    seen.update(self.symmetry_maps[s][row][col] for s in symmetries)
+            moves = unique
+        return moves
+
+    @classmethod
+    def distance(cls, value, empty_count):
+        # Plies until the game ends under perfect play
+        return cls.WIN - abs(value) if value else empty_count
+
+    def child_value(self, row, col, player, alpha, beta):
+        # Value of playing (row, col) for player, with the win/draw/loss distance folded in
+        self.place(row, col, player)
+        try:
+            if self.bitboard.is_win(player):
+                return self.WIN - 1
+            if self.empty_count == 0:
+                return 0
+            value = -self.negamax(other_player(player), -beta, -alpha)
+        finally:
+            self.remove(row, col, player)
+        if value > 0:
+            return value - 1
+        if value < 0:
+            return value + 1
+        return 0
+
+    def negamax(self, player, alpha, beta):
+        self.nodes += 1
+        if self.nodes % self.CHECK_EVERY == 0 and self.out_of_time():
+            raise SearchTimeout()
+
+        key, symmetry = self.position_key()
+        entry = self.table.get(key)
+        hash_move = None
+        if entry is not None:
+            flag, value, hash_move = entry
+            if flag == self.EXACT:
+                return value
+            if flag == self.LOWER:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                return value
+            hash_move = self.symmetry_inverses[symmetry][hash_move[0]][hash_move[1]]
+
+        wins = self.winning_moves(player)
+        if wins:
+            self.table[key] = (self.EXACT, self.WIN - 1, self.symmetry_maps[symmetry][wins[0][0]][wins[0][1]])
+            return self.WIN - 1
+
+        moves = self.forcing_moves(player)
+        if hash_move in moves:
+            moves.remove(hash_move)
+            moves.insert(0, hash_move)
+
+        alpha_orig = alpha
+        best_value, best_move = -self.WIN - 1, None
+        for row, col in moves:
+            # Widen by one so the distance adjustment cannot hide a cutoff
+            value = self.child_value(row, col, player, alpha - 1, beta + 1)
+            if value > best_value:
+                best_value, best_move = value, (row, col)
+            alpha = max(alpha, best_value)
+            if alpha >= beta:
+                break
+
+        if best_value <= alpha_orig:
+            flag = self.UPPER
+        elif best_value >= beta:
+            flag = self.LOWER
+        else:
+            flag = self.EXACT
+        self.table[key] = (flag, best_value, self.symmetry_maps[symmetry][best_move[0]][best_move[1]])
+        return best_value
+
+    def out_of_time(self):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            return True
+        return self.deadline is not None and time.perf_counter() > self.deadline
+
+    def solve(self, player):
+        # Exact best move for player: ((row, col), value, distance), or None when out of time
+        if self.empty_count == 0:
+            return None
+        try:
+            value = self.negamax(player, -self.WIN - 1, self.WIN + 1)
+        except SearchTimeout:
+            return None
+        key, symmetry = self.position_key()
+        move = self.table[key][2]
+        row, col = self.symmetry_inverses[symmetry][move[0]][move[1]]
+        return (row, col), value, self.distance(value, self.empty_count)
+
+    def solve_all(self, player, max_positions=None):
+        # Full-window solve of every position reachable from here, so every table
+        # entry is exact. Returns the value for player.
+        key, symmetry = self.position_key()
+        entry = self.table.get(key)
+        if entry is not None:
+            return entry[1]
+        if max_positions is not None and len(self.table) >= max_positions:
+            raise MemoryError('more than %d positions' % max_positions)
+
+        wins = self.winning_moves(player)
+        if wins:
+            self.table[key] = (self.EXACT, self.WIN - 1, self.symmetry_maps[symmetry][wins[0][0]][wins[0][1]])
+            return self.WIN - 1
+
+        best_value, best_move = -self.WIN - 1, None
+        opponent = other_player(player)
+        for row, col in self.forcing_moves(player):
+            self.place(row, col, player)
+            if self.empty_count == 0:
+                value = 0
+            else:
+                value = -self.solve_all(opponent, max_positions)
+                value = value - 1 if value > 0 else value + 1 if value < 0 else 0
+            self.remove(row, col, player)
+            if value > best_value:
+                best_value, best_move = value, (row, col)
+        self.table[key] = (self.EXACT, best_value, self.symmetry_maps[symmetry][best_move[0]][best_move[1]])
+        return best_value
+
+
+def generate(size, win_condition, max_positions=None):
+    # {canonical key: (row, col, value, distance)} for every reachable position
+    solver = Solver([[''] * size for _ in range(size)], win_condition)
+    solver.solve_all('X', max_positions)
+    entries = {}
+    for key, (_, value, (row, col)) in solver.table.items():
+        entries[key] = (row, col, value, min(255, Solver.WIN - abs(value) if value else 0))
+    return entries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Caro exact solver for small boards')
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name in ('generate', 'solve'):
+        sub = commands.add_parser(name)
+        sub.add_argument('--size', type=int, required=True)
+        sub.add_argument('--win', type=int, required=True)
+        if name == 'generate':
+            sub.add_argument('--table', help='output file (default caro_table_<size>x<size>_<win>.bin)')
+            sub.add_argument('--max-positions', type=int, default=5000000, help='give up beyond this many positions')
+        else:
+            sub.add_argument('--moves', default='', help='moves played so far, X first, e.g. "1,1 0,0"')
+            sub.add_argument('--time-ms', type=int, help='give up after this long')
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        path = args.table or table_path(args.size, args.win)
+        started = time.perf_counter()
+        try:
+            entries = generate(args.size, args.win, args.max_positions)
+        except MemoryError as e:
+            print('too large to tabulate: %s' % e)
+            return 1
+        SolvedTable.write(path, args.size, args.win, entries)
+        print('%s: %d positions in %.1f s' % (path, len(entries), time.perf_counter() - started))
+    else:
+        game = CaroGame({'board_size': args.size, 'win_condition': args.win})
+        for row, col in parse_moves(args.moves):
+            game.play(row, col)
+        started = time.perf_counter()
+        solver = Solver(game.board, args.win, args.time_ms)
+        result = solver.solve(game.current_player)
+        if result is None:
+            print('not solved in time (%d nodes)' % solver.nodes)
+            return 1
+        move, value, distance = result
+        outcome = 'win' if value > 0 else 'loss' if value < 0 else 'draw'
+        print('%d %d: %s for %s in %d plies (%d nodes, %.2f s)' % (
+            move[0], move[1], outcome, game.current_player, distance, solver.nodes, time.perf_counter() - started))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
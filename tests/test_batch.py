@@ -0,0 +1,24 @@
+"""NumPy batch analysis against the per-board evaluator path."""
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from caro_batch import X, O, analyse_batch, analyse_batch_python, encode_boards, random_boards
+
+
+@pytest.mark.parametrize('size,win_condition', [(3, 3), (7, 4), (10, 5), (15, 5), (19, 5)])
+def test_batch_matches_per_board(size, win_condition):
+    boards = random_boards(40, size, seed=size * 10 + win_condition)
+    batch = analyse_batch(np.array(boards, dtype=np.int8), win_condition)
+    python = analyse_batch_python(boards, win_condition)
+    assert batch['score'].tolist() == python['score']
+    assert batch['winner'].tolist() == python['winner']
+    assert batch['threats'].tolist() == python['threats']
+
+
+def test_encode_boards():
+    boards = [[['X', '', 'O'], ['', 'X', ''], ['O', '', 'X']]]
+    encoded = encode_boards(boards)
+    assert encoded.shape == (1, 3, 3)
+    assert encoded[0].tolist() == [[X, 0, O], [0, X, 0], [O, 0, X]]
+    assert analyse_batch(encoded, 3)['winner'].tolist() == [X]
@@ -0,0 +1,65 @@
+"""BitBoard win detection against a brute-force scan of every line."""
+import random
+
+import pytest
+
+from caro_engine import BitBoard, CaroAI
+
+
+def brute_force_win(board, player, win_condition, exact):
+    # Measures every maximal run of player's stones
+    size = len(board)
+    for row in range(size):
+        for col in range(size):
+            if board[row][col] != player:
+                continue
+            for dr, dc in CaroAI.DIRECTIONS:
+                r, c = row - dr, col - dc
+                if 0 <= r < size and 0 <= c < size and board[r][c] == player:
+                    continue  # not the start of the run
+                length = 0
+                r, c = row, col
+                while 0 <= r < size and 0 <= c < size and board[r][c] == player:
+                    length += 1
+                    r, c = r + dr, c + dc
+                if length == win_condition or (length > win_condition and not exact):
+                    return True
+    return False
+
+
+def random_board(rng, size):
+    # Sparse to crowded boards, often leaning to one colour so that runs form
+    fill = rng.uniform(0.1, 0.9)
+    x_share = rng.choice([0.5, 0.8, 0.95])
+    return [['' if rng.random() > fill else 'X' if rng.random() < x_share else 'O' for _ in range(size)]
+            for _ in range(size)]
+
+
+@pytest.mark.parametrize('exact', [False, True])
+@pytest.mark.parametrize('size, win_condition', [(3, 3), (5, 4), (7, 5), (10, 5), (15, 5), (19, 6)])
+def test_is_win_matches_brute_force(size, win_condition, exact):
+    rng = random.Random(size * 100 + win_condition)
+    outcomes = set()
+    for _ in range(300):
+        board = random_board(rng, size)
+        bitboard = BitBoard.from_board(board, win_condition, exact)
+        for player in ('X', 'O'):
+            expected = brute_force_win(board, player, win_condition, exact)
+            assert bitboard.is_win(player) == expected, board
+            outcomes.add(expected)
+    assert outcomes == {True, False}
+
+
+def test_overline_wins_only_under_freestyle():
+    board = [[''] * 7 for _ in range(7)]
+    for col in range(1, 5):
+        board[3][col] = 'X'
+    assert BitBoard.from_board(board, 3).is_win('X')
+    assert not BitBoard.from_board(board, 3, exact=True).is_win('X')
+
+
+def test_edge_runs_do_not_wrap_around():
+    # Stones at the end of one row and the start of the next are not a line
+    board = [[''] * 5 for _ in range(5)]
+    board[0][3] = board[0][4] = board[1][0] = board[1][1] = 'X'
+    assert not BitBoard.from_board(board, 4).is_win('X')
@@ -0,0 +1,41 @@
+"""PatternEvaluator's incremental updates against an evaluator built from scratch."""
+import random
+
+import pytest
+
+from caro_engine import PatternEvaluator
+
+
+def rebuilt(board, win_condition, exact):
+    evaluator = PatternEvaluator(len(board), win_condition, exact)
+    for row, cells in enumerate(board):
+        for col, player in enumerate(cells):
+            if player:
+                evaluator.place(row, col, player)
+    return evaluator
+
+
+@pytest.mark.parametrize('exact', [False, True])
+@pytest.mark.parametrize('size, win_condition', [(5, 4), (10, 5), (15, 5)])
+def test_place_and_remove_match_rebuild(size, win_condition, exact):
+    rng = random.Random(size * 10 + win_condition)
+    board = [[''] * size for _ in range(size)]
+    evaluator = PatternEvaluator(size, win_condition, exact)
+    stones = []
+    for step in range(400):
+        if stones and rng.random() < 0.4:
+            row, col = stones.pop(rng.randrange(len(stones)))
+            evaluator.remove(row, col, board[row][col])
+            board[row][col] = ''
+        else:
+            empty = [(r, c) for r in range(size) for c in range(size) if not board[r][c]]
+            if not empty:
+                continue
+            row, col = rng.choice(empty)
+            board[row][col] = rng.choice('XO')
+            evaluator.place(row, col, board[row][col])
+            stones.append((row, col))
+        if step % 20 == 0:
+            expected = rebuilt(board, win_condition, exact)
+            assert evaluator.score == expected.score
+            assert evaluator.pattern_counts == expected.pattern_counts
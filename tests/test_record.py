@@ -0,0 +1,97 @@
+"""Game records: write/read round trips, replay and version 1 archives."""
+import random
+
+import pytest
+
+from caro_engine import CaroGame
+from caro_record import (FILE_HEADER, FLAG_AI_O, FLAG_AI_X, FLAG_EXACT, MAGIC, GameReader, GameRecord,
+                         GameWriter, append_game, record_from_game, replay)
+
+
+def random_game(rng, size, win_condition, rule):
+    # Random legal moves until the game ends or a random move count is reached
+    game = CaroGame({'board_size': size, 'win_condition': win_condition, 'win_rule': rule})
+    cells = [(row, col) for row in range(size) for col in range(size)]
+    rng.shuffle(cells)
+    for row, col in cells[:rng.randint(0, len(cells))]:
+        if game.play(row, col) is not None:
+            break
+    return game
+
+
+@pytest.mark.parametrize('size,win_condition', [(3, 3), (7, 4), (15, 5), (19, 5)])
+def test_round_trip_and_replay(tmp_path, size, win_condition):
+    rng = random.Random(size)
+    path = str(tmp_path / 'games.bin')
+    records = []
+    for i in range(30):
+        rule = 'exact' if i % 2 else 'freestyle'
+        game = random_game(rng, size, win_condition, rule)
+        records.append(record_from_game(game, flags=i % 4))
+    with GameWriter(path) as writer:
+        for record in records:
+            writer.write_record(record)
+    assert writer.count == len(records)
+
+    read = list(GameReader(path))
+    # The writer sets FLAG_EXACT from the rule
+    assert read == [record._replace(flags=record.flags | (FLAG_EXACT if record.rule == 'exact' else 0))
+                    for record in records]
+    for record in read:
+        game = replay(record)
+        assert [(row, col) for row, col, _ in game.move_history] == record.moves
+        assert record_from_game(game, record.flags) == record
+
+
+def test_flags_and_results(tmp_path):
+    path = str(tmp_path / 'games.bin')
+    with GameWriter(path) as writer:
+        writer.write(5, 4, [(0, 0), (1, 1)], None, FLAG_AI_X)
+        writer.write(5, 4, [], 'draw', FLAG_AI_O | FLAG_EXACT)  # the rule argument decides FLAG_EXACT
+        writer.write(19, 5, [(18, 18)], 'X', 0, 'exact')
+    assert list(GameReader(path)) == [
+        GameRecord(5, 4, None, [(0, 0), (1, 1)], FLAG_AI_X, 'freestyle'),
+        GameRecord(5, 4, 'draw', [], FLAG_AI_O, 'freestyle'),
+        GameRecord(19, 5, 'X', [(18, 18)], FLAG_EXACT, 'exact'),
+    ]
+
+
+def test_exact_rule_overline_replays_without_a_winner(tmp_path):
+    # X's fifth stone joins 0,0-0,1 and 0,3-0,4 into an overline of five
+    moves = [(0, 0), (6, 0), (0, 1), (6, 2), (0, 3), (6, 4), (0, 4), (6, 6), (0, 2), (4, 0), (3, 3)]
+    path = str(tmp_path / 'games.bin')
+    with GameWriter(path) as writer:
+        writer.write(7, 3, moves, None, 0, 'exact')
+    record, = GameReader(path)
+    assert record.rule == 'exact'
+    game = replay(record)
+    assert len(game.move_history) == 11
+    assert game.winner is None
+    assert replay(record._replace(rule='freestyle')).winner == 'X'
+
+
+def test_append_upgrades_version_1_header(tmp_path):
+    path = str(tmp_path / 'games.bin')
+    with GameWriter(path) as writer:
+        writer.write(7, 4, [(3, 3), (3, 4)], None)
+    with open(path, 'r+b') as f:
+        f.write(FILE_HEADER.pack(MAGIC, 1))
+
+    game = CaroGame({'board_size': 7, 'win_condition': 4, 'win_rule': 'exact'})
+    game.play(0, 0)
+    append_game(path, game, FLAG_AI_O)
+    with open(path, 'rb') as f:
+        assert FILE_HEADER.unpack(f.read(FILE_HEADER.size)) == (MAGIC, 2)
+    assert list(GameReader(path)) == [
+        GameRecord(7, 4, None, [(3, 3), (3, 4)], 0, 'freestyle'),
+        GameRecord(7, 4, None, [(0, 0)], FLAG_AI_O | FLAG_EXACT, 'exact'),
+    ]
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'games.bin'
+    path.write_bytes(FILE_HEADER.pack(b'NOPE', 1))
+    with pytest.raises(ValueError):
+        list(GameReader(str(path)))
+    with pytest.raises(ValueError):
+        GameWriter(str(path), append=True)
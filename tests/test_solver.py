@@ -0,0 +1,86 @@
+"""Solver values against a plain memoised negamax over every move."""
+import random
+
+import pytest
+
+from caro_engine import BitBoard, other_player
+from caro_solver import Solver
+
+
+def naive_value(board, bitboard, player, memo):
+    # Same convention as Solver: a win in d plies is WIN - d, a loss -(WIN - d)
+    key = (tuple(map(tuple, board)), player)
+    if key in memo:
+        return memo[key]
+    best = None
+    for row, cells in enumerate(board):
+        for col, cell in enumerate(cells):
+            if cell:
+                continue
+            board[row][col] = player
+            bitboard.place(row, col, player)
+            if bitboard.is_win(player):
+                value = Solver.WIN - 1
+            elif bitboard.is_full():
+                value = 0
+            else:
+                value = -naive_value(board, bitboard, other_player(player), memo)
+                value = value - 1 if value > 0 else value + 1 if value < 0 else 0
+            bitboard.remove(row, col, player)
+            board[row][col] = ''
+            if best is None or value > best:
+                best = value
+    memo[key] = best
+    return best
+
+
+def random_position(rng, size, win_condition, stones, exact):
+    # A position with no winner yet and no immediate win for the side to move
+    # (X when stones is even), so the values are not all trivial
+    player = 'X' if stones % 2 == 0 else 'O'
+    while True:
+        board = [[''] * size for _ in range(size)]
+        cells = rng.sample([(r, c) for r in range(size) for c in range(size)], stones)
+        for i, (row, col) in enumerate(cells):
+            board[row][col] = 'X' if i % 2 == 0 else 'O'
+        bitboard = BitBoard.from_board(board, win_condition, exact)
+        if bitboard.is_win('X') or bitboard.is_win('O'):
+            continue
+        wins = False
+        for row, col in ((r, c) for r in range(size) for c in range(size) if not board[r][c]):
+            bitboard.place(row, col, player)
+            wins = wins or bitboard.is_win(player)
+            bitboard.remove(row, col, player)
+        if not wins:
+            return board
+
+
+def check(board, win_condition, player, exact):
+    memo = {}
+    expected = naive_value([row[:] for row in board], BitBoard.from_board(board, win_condition, exact), player, memo)
+    move, value, _ = Solver(board, win_condition, exact=exact).solve(player)
+    assert value == expected
+    # The returned move must actually reach that value
+    after = [row[:] for row in board]
+    after[move[0]][move[1]] = player
+    bitboard = BitBoard.from_board(after, win_condition, exact)
+    if bitboard.is_win(player):
+        assert value == Solver.WIN - 1
+    elif bitboard.is_full():
+        assert value == 0
+    else:
+        reply = -naive_value(after, bitboard, other_player(player), memo)
+        assert value == (reply - 1 if reply > 0 else reply + 1 if reply < 0 else 0)
+
+
+def test_empty_3x3_is_a_draw():
+    check([[''] * 3 for _ in range(3)], 3, 'X', False)
+
+
+@pytest.mark.parametrize('exact', [False, True])
+@pytest.mark.parametrize('size, win_condition, stones', [(4, 3, 8), (4, 4, 7), (5, 4, 16)])
+def test_solver_matches_naive_negamax(size, win_condition, stones, exact):
+    rng = random.Random(size * 100 + win_condition * 10 + stones)
+    for _ in range(6):
+        board = random_position(rng, size, win_condition, stones, exact)
+        check(board, win_condition, 'X' if stones % 2 == 0 else 'O', exact)
@@ -0,0 +1,72 @@
+"""VCF lines from ThreatSearch, replayed move by move and confirmed by the solver."""
+import random
+
+import pytest
+
+from caro_engine import BitBoard, ThreatSearch, other_player
+from caro_solver import Solver
+
+
+def winning_moves(bitboard, size, player):
+    moves = set()
+    for row in range(size):
+        for col in range(size):
+            if bitboard.is_empty(row, col):
+                bitboard.place(row, col, player)
+                if bitboard.is_win(player):
+                    moves.add((row, col))
+                bitboard.remove(row, col, player)
+    return moves
+
+
+def random_position(rng, size, win_condition, stones, exact):
+    # No winner yet and no immediate win for X, who is to move
+    while True:
+        board = [[''] * size for _ in range(size)]
+        cells = rng.sample([(r, c) for r in range(size) for c in range(size)], stones)
+        for i, (row, col) in enumerate(cells):
+            board[row][col] = 'X' if i % 2 == 0 else 'O'
+        bitboard = BitBoard.from_board(board, win_condition, exact)
+        if bitboard.is_win('X') or bitboard.is_win('O'):
+            continue
+        if not winning_moves(bitboard, size, 'X'):
+            return board
+
+
+def check_line(board, win_condition, exact, attacker, line):
+    # Every attacker move but the last leaves exactly one winning cell and the
+    # defender takes it; the last attacker move wins or leaves two winning cells
+    size = len(board)
+    bitboard = BitBoard.from_board(board, win_condition, exact)
+    defender = other_player(attacker)
+    assert len(line) % 2 == 1
+    for i in range(0, len(line), 2):
+        row, col = line[i]
+        assert bitboard.is_empty(row, col)
+        bitboard.place(row, col, attacker)
+        if i == len(line) - 1:
+            assert bitboard.is_win(attacker) or len(winning_moves(bitboard, size, attacker)) > 1
+            return
+        assert not bitboard.is_win(attacker)
+        assert winning_moves(bitboard, size, attacker) == {line[i + 1]}
+        bitboard.place(line[i + 1][0], line[i + 1][1], defender)
+        assert not bitboard.is_win(defender)
+
+
+@pytest.mark.parametrize('exact', [False, True])
+@pytest.mark.parametrize('size,win_condition,stones', [(5, 4, 12), (5, 4, 14)])
+def test_vcf_wins_are_real(size, win_condition, stones, exact):
+    rng = random.Random(size * 100 + stones + exact)
+    found = 0
+    for _ in range(200):
+        board = random_position(rng, size, win_condition, stones, exact)
+        line = ThreatSearch(board, win_condition, exact=exact).vcf('X')
+        if line is None:
+            continue
+        check_line(board, win_condition, exact, 'X', line)
+        _, value, _ = Solver(board, win_condition, exact=exact).solve('X')
+        assert value > 0, (board, line)
+        found += 1
+        if found == 4:
+            break
+    assert found == 4